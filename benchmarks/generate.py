@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+from utils.local_sheets import DEFAULT_HEADERS
+from utils.transaction import transaction_ids
+
+# === Synthetic Ledger ===
+# Realistic-looking sheets for two people over several years: monthly salaries, rent and
+# EMIs, plus everyday spending spread over merchants that the categorization rules know.
+PEOPLE = ["Divyaraj", "Nithya"]
+ACCOUNTS = {"Divyaraj": ("50100012345678", "HDFC"), "Nithya": ("91001098765432", "ICICI")}
+CARDS = {"Divyaraj": ("XXXX1234", "HDFC Regalia"), "Nithya": ("XXXX9876", "Amazon Pay ICICI")}
+GOALS = ["Wedding Plan", "Gold Plan", "IITM Course", "CFA", "General Savings", "Emergency Fund"]
+
+# merchant, my_category, typical amount (₹)
+MERCHANTS = [
+    ("Swiggy", "Food", 450), ("Zomato", "Food", 520), ("Starbucks", "Food", 380),
+    ("Uber", "Transport - Internal", 260), ("Indian Oil", "Transport - Internal", 1800),
+    ("IRCTC", "Transport - External", 1400), ("IndiGo", "Transport - External", 6200),
+    ("BigBasket", "Home Expenses", 2100), ("BESCOM Electricity", "Home Expenses", 1600),
+    ("Amazon", "Shopping", 1900), ("Myntra", "Shopping", 2400),
+    ("Apollo Pharmacy", "Personal Care", 700), ("Cult Gym", "Personal Care", 1500),
+    ("BookMyShow", "Leisure", 900), ("Netflix", "Subscriptions", 649),
+    ("Zerodha Mutual Fund SIP", "Savings", 10000),
+]
+SIP = "Zerodha Mutual Fund SIP"  # mandate debits: no UPI reference in the export
+BUDGET_CATEGORIES = sorted({category for _, category, _ in MERCHANTS} | {"Rent", "EMI"})
+CREDIT_SHARE = 0.3      # share of everyday spending put on cards
+UNCATEGORIZED = 0.15    # share of rows with a blank my_category
+SAVINGS_ALLOCATED = 0.8  # share of savings debits already allocated to a goal
+LEGACY_SAVINGS = 0.25    # share of allocations written before txn_id existed
+DOUBLE_DEBITS = 0.02     # share of SIP debits taken twice (identical rows in the export)
+SPEND_PER_MONTH = 45000  # everyday spending cap per person-month, below take-home after rent and EMI
+
+
+def _timestamps(rng, start, end, size):
+    seconds = rng.integers(int(start.timestamp()), int(end.timestamp()), size)
+    return pd.to_datetime(np.sort(seconds), unit="s")
+
+
+def _iso(stamps):
+    return list(stamps.strftime("%Y-%m-%dT%H:%M:%S+05:30"))
+
+
+def _money(values):
+    # As Sheets displays them: whole rupees without decimals, paise with two
+    return [str(int(v)) if float(v).is_integer() else f"{v:.2f}" for v in values]
+
+
+def _amounts(rng, typical):
+    amounts = np.round(typical * rng.lognormal(0, 0.5, len(typical)))
+    paise = rng.random(len(typical)) < 0.1
+    amounts[paise] += rng.integers(1, 100, paise.sum()) / 100
+    return np.maximum(amounts, 1)
+
+
+def generate_ledger(rows, years=5, seed=0):
+    """
+    Returns {worksheet_name: [header, row, ...]} with about `rows` bank + credit card
+    transactions spread over `years` years, plus matching budget, income and savings sheets.
+    """
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp("2025-12-31 23:59:59")
+    start = end - pd.DateOffset(years=years)
+    months = pd.period_range(start, end, freq="M")
+
+    # --- Fixed monthly rows: salary, rent, EMI ---
+    fixed = []
+    for person in PEOPLE:
+        for month in months:
+            day = month.to_timestamp()
+            fixed.append((person, day + pd.Timedelta(hours=9), "Acme Payroll", "Salary", 95000, "CREDIT"))
+            fixed.append((person, day + pd.Timedelta(days=4, hours=10), "Rent Transfer", "Rent", 18000, "DEBIT"))
+            fixed.append((person, day + pd.Timedelta(days=6, hours=11), "Home Loan EMI", "EMI", 22000, "DEBIT"))
+    fixed = pd.DataFrame(fixed, columns=["person", "when", "merchant", "my_category", "amount", "type"])
+
+    # --- Everyday spending ---
+    spend_rows = max(rows - len(fixed), 0)
+    picks = rng.integers(0, len(MERCHANTS), spend_rows)
+    typical = np.array([MERCHANTS[i][2] for i in picks], dtype=float)
+    # Large ledgers mean many more rows per month, so shrink amounts to keep spending within
+    # income; np.exp(0.125) is the mean of the lognormal spread applied in _amounts.
+    expected = typical.sum() * np.exp(0.125)
+    if expected:
+        typical *= min(1.0, SPEND_PER_MONTH * len(PEOPLE) * len(months) / expected)
+    spend = pd.DataFrame({
+        "person": rng.choice(PEOPLE, spend_rows),
+        "when": _timestamps(rng, start, end, spend_rows),
+        "merchant": [MERCHANTS[i][0] for i in picks],
+        "my_category": [MERCHANTS[i][1] for i in picks],
+        "amount": _amounts(rng, typical),
+        "type": "DEBIT",
+    })
+    twice = spend[(spend["merchant"] == SIP) & (rng.random(spend_rows) < DOUBLE_DEBITS)]
+    spend = pd.concat([spend, twice]).sort_values("when", kind="stable").reset_index(drop=True)
+    refunds = (rng.random(len(spend)) < 0.02) & (spend["merchant"] != SIP).to_numpy()
+    spend.loc[refunds, "type"] = "CREDIT"
+    on_card = (rng.random(len(spend)) < CREDIT_SHARE) & (spend["my_category"] != "Savings").to_numpy()
+
+    bank = pd.concat([fixed, spend[~on_card]], ignore_index=True).sort_values("when", kind="stable")
+    credit = spend[on_card].sort_values("when", kind="stable")
+    for df in (bank, credit):
+        blank = (rng.random(len(df)) < UNCATEGORIZED) & (df["my_category"] != "Salary").to_numpy()
+        df.loc[blank, "my_category"] = ""
+
+    # --- Bank sheet with a running balance per account ---
+    signed = np.where(bank["type"] == "CREDIT", bank["amount"], -bank["amount"])
+    balance = 250000 + pd.Series(signed, index=bank.index).groupby(bank["person"]).cumsum()
+    bank_stamps = pd.DatetimeIndex(bank["when"])
+    bank_rows = pd.DataFrame({
+        "account_number": bank["person"].map(lambda p: ACCOUNTS[p][0]),
+        "txn_timestamp": _iso(bank_stamps),
+        "amount": _money(bank["amount"]),
+        "current_balance": _money(balance.round(2)),
+        "type": bank["type"],
+        "reference": np.where(bank["merchant"] == SIP, "", [f"UPI{n:012d}" for n in rng.permutation(len(bank))]),
+        "merchant": bank["merchant"],
+        "category_icon_name": "",
+        "category": "",
+        "bank_name": bank["person"].map(lambda p: ACCOUNTS[p][1]),
+        "notes": "",
+        "person": bank["person"],
+        "date": list(bank_stamps.strftime("%Y-%m-%d")),
+        "time": list(bank_stamps.strftime("%H:%M:%S")),
+        "my_category": bank["my_category"],
+    })
+
+    credit_stamps = pd.DatetimeIndex(credit["when"])
+    credit_rows = pd.DataFrame({
+        "card_number": credit["person"].map(lambda p: CARDS[p][0]),
+        "card_name": credit["person"].map(lambda p: CARDS[p][1]),
+        "txn_timestamp": _iso(credit_stamps),
+        "amount": _money(credit["amount"]),
+        "type": credit["type"],
+        "merchant": credit["merchant"],
+        "category_icon_name": "",
+        "category": "",
+        "notes": "",
+        "person": credit["person"],
+        "date": list(credit_stamps.strftime("%Y-%m-%d")),
+        "time": list(credit_stamps.strftime("%H:%M:%S")),
+        "my_category": credit["my_category"],
+    })
+
+    # --- Budget and income: one row per month × person × category ---
+    budget_rows = pd.DataFrame([
+        (str(month), person, category, int(rng.integers(5, 40)) * 500)
+        for month in months for person in PEOPLE for category in BUDGET_CATEGORIES
+    ], columns=DEFAULT_HEADERS["budget"])
+    income_rows = pd.DataFrame([
+        (str(month), person, category, amount)
+        for month in months for person in PEOPLE
+        for category, amount in (("Salary", 95000), ("Freelancing", int(rng.integers(0, 20)) * 1000))
+    ], columns=DEFAULT_HEADERS["income"])
+
+    # --- Savings: most savings debits are allocated, some by legacy rows without txn_id ---
+    saved = bank_rows[(bank_rows["my_category"] == "Savings") & (bank_rows["type"] == "DEBIT")]
+    saved = saved[rng.random(len(saved)) < SAVINGS_ALLOCATED]
+    txn_ids = transaction_ids(bank_rows, "bank_transactions")[saved.index]  # copy numbers count every row
+    txn_ids[rng.random(len(saved)) < LEGACY_SAVINGS] = ""
+    savings_rows = pd.DataFrame({
+        "txn_timestamp": saved["txn_timestamp"],
+        "description": "Savings",
+        "amount": saved["amount"],
+        "allocated_to": rng.choice(GOALS, len(saved)),
+        "txn_id": txn_ids,
+    })
+
+    sheets = {
+        "bank_transactions": bank_rows, "credit_card": credit_rows,
+        "budget": budget_rows, "income": income_rows, "savings": savings_rows,
+    }
+    return {name: [list(df.columns)] + df.astype(str).values.tolist() for name, df in sheets.items()}
+
+
+def statement_csv(ledger, worksheet_name, rows, seed=1):
+    """
+    Builds an upload CSV (export columns only) of `rows` transactions: the newest half
+    already exists in the sheet, the rest are new, so the import's dedup path is exercised too.
+    """
+    from import_ import BANK_COLS, CC_COLS
+    columns = BANK_COLS if worksheet_name == "bank_transactions" else CC_COLS
+    header, *values = ledger[worksheet_name]
+    df = pd.DataFrame(values, columns=header)[columns]
+    existing = df.tail(rows // 2)
+    fresh = df.sample(rows - len(existing), replace=True, random_state=seed).copy()
+    fresh["reference" if "reference" in fresh.columns else "merchant"] += "-NEW" + pd.Series(
+        range(len(fresh)), index=fresh.index).astype(str)
+    return pd.concat([existing, fresh]).to_csv(index=False).encode("utf-8")
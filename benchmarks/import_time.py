@@ -0,0 +1,83 @@
+"""
+Cold-start import report for home.py, based on `python -X importtime`.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --top 15 --runs 5
+
+Measures, in fresh interpreters, the imports home.py needs before its first render and
+what each page adds when it is first opened. "home (all pages eager)" is the cost of
+importing every page up front, for comparison with the lazy router.
+"""
+import os
+import re
+import ast
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_MODULES = ["home_dashboard", "budgeting", "import_", "data", "pages.savings"]
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def home_imports():
+    """
+    Modules imported at the top level of home.py.
+    """
+    with open(os.path.join(ROOT, "home.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def measure(modules, preloaded=()):
+    """
+    Imports `modules` in a fresh interpreter (after `preloaded`, which is not counted).
+    Returns (total_ms, [(cumulative_ms, module), ...]) for top-level imports.
+    """
+    code = "; ".join([f"import {m}" for m in preloaded] + ["import sys; sys.stderr.write('--start--\\n')"]
+                     + [f"import {m}" for m in modules])
+    env = dict(os.environ, STREAMLIT_LOG_LEVEL="error")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    measured = result.stderr.split("--start--\n", 1)[1]
+    top = []
+    total_us = 0
+    for self_us, cumulative_us, indent, name in LINE.findall(measured):
+        total_us += int(self_us)
+        if len(indent) == 1:
+            top.append((int(cumulative_us) / 1000, name))
+    return total_us / 1000, sorted(top, reverse=True)
+
+
+def best_of(runs, modules, preloaded=()):
+    return min((measure(modules, preloaded) for _ in range(runs)), key=lambda m: m[0])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per scenario (best is reported)")
+    parser.add_argument("--top", type=int, default=8, help="heaviest top-level imports to list")
+    args = parser.parse_args(argv)
+
+    home = [m for m in home_imports() if m not in PAGE_MODULES]
+    scenarios = [
+        ("home (all pages eager)", home + PAGE_MODULES, ()),
+        ("home (lazy pages)", home, ()),
+    ] + [(f"+ open {page}", [page], tuple(home)) for page in PAGE_MODULES]
+
+    for label, modules, preloaded in scenarios:
+        total_ms, top = best_of(args.runs, modules, preloaded)
+        print(f"\n{label:<28}{total_ms:>10.1f} ms")
+        for cumulative_ms, name in top[:args.top]:
+            print(f"    {name:<36}{cumulative_ms:>10.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
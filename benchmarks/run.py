@@ -0,0 +1,212 @@
+"""
+Times each page's data path against a synthetic ledger on the local Sheets backend.
+
+    python -m benchmarks.run                      # 10k, 100k rows
+    python -m benchmarks.run --rows 10000 1000000 --years 5 --json results.json
+    python -m benchmarks.run --latency-ms 150     # add simulated Sheets round-trip time
+    python -m benchmarks.run --error-rate 0.2     # inject 429s to exercise the request scheduler
+
+Reports wall time, peak Python memory (tracemalloc), Sheets API requests, cells read and
+scheduler retries per stage. Writes made by the stages are only journaled (as in the app); the
+last stage sends them to the local backend.
+Pass --no-memory for timings without tracemalloc overhead.
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import logging
+
+# Must be set before any app module reads them
+_workdir = tempfile.mkdtemp(prefix="cofi-bench-")
+os.environ["COFI_SHEETS_BACKEND"] = "local"
+os.environ["COFI_LOCAL_SHEETS_PATH"] = ":memory:"
+os.environ.setdefault("COFI_DB_PATH", os.path.join(_workdir, "bench.db"))
+os.environ["COFI_WRITE_DELAY"] = "3600"  # queued writes are sent by the "flush write journal" stage instead
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+import pandas as pd
+from utils import store, gsheet, local_sheets
+from utils.context import DataContext
+from utils.transaction import parse_timestamps
+from utils.budget import budget_vs_actual, select
+from benchmarks.generate import generate_ledger, statement_csv
+from data import uncategorized_mask
+from import_ import import_statement, BANK_COLS, BANK_SHEET
+from pages.savings import link_legacy_rows
+
+SHEET_URL = store.SHEET_URL
+IMPORT_ROWS = 2000
+APPENDED_ROWS = 50  # rows added in Google Sheets between two loads
+
+
+class Upload(io.BytesIO):
+    """Stands in for Streamlit's UploadedFile, which the importer only calls getvalue() on."""
+
+
+def _reset(rows, years):
+    gsheet.reset_client()
+    if os.path.exists(store.DB_PATH):
+        os.remove(store.DB_PATH)
+    spreadsheet = local_sheets.open_spreadsheet(SHEET_URL, path=":memory:")
+    ledger = generate_ledger(rows, years)
+    spreadsheet.data.clear()
+    spreadsheet.data.update({name: [list(row) for row in values] for name, values in ledger.items()})
+    return ledger
+
+
+# === Page data paths ===
+def home_quick_stats():
+    ctx = DataContext()
+    bank_df = ctx.transactions("bank_transactions")
+    cube = ctx.cube()
+    balances = ctx.latest_balances()
+    latest_balance = balances["balance"].iloc[0] if not balances.empty else 0
+    debits = cube[cube["type"] == "DEBIT"]
+    month = bank_df["txn_timestamp"].max().strftime("%Y-%m")
+    monthly_expenses = debits[(debits["source"] == "bank") & (debits["month"] == month)]["amount"].sum()
+    credit_expenses = debits[debits["source"] == "credit"]["amount"].sum()
+    return latest_balance, monthly_expenses, credit_expenses
+
+
+def dashboard_budget_vs_actual():
+    ctx = DataContext()
+    table = budget_vs_actual(ctx.frame("budget"), ctx.cube())  # uncached, as on a data change
+    return select(table, table["month"].max()), ctx.latest_balances()["balance"].sum(), ctx.net_worth("M")
+
+
+def data_uncategorized():
+    ctx = DataContext()
+    return {name: int(uncategorized_mask(ctx.frame(name)).sum()) for name in ("bank_transactions", "credit_card")}
+
+
+def import_upload(ledger):
+    upload = Upload(statement_csv(ledger, BANK_SHEET, IMPORT_ROWS))
+    import_statement(upload, BANK_COLS, BANK_SHEET, "Divyaraj", "Bank")
+
+
+def resync_after_append(ledger):
+    # Rows added by another device: the next load fetches only those (plus the last row seen)
+    spreadsheet = local_sheets.open_spreadsheet(SHEET_URL, path=":memory:")
+    spreadsheet.data[BANK_SHEET] += [list(row) for row in ledger[BANK_SHEET][-APPENDED_ROWS:]]
+    store.mark_stale(BANK_SHEET)
+    return DataContext().frame(BANK_SHEET)
+
+
+def savings_reconciliation():
+    ctx = DataContext()
+    bank_df = ctx.transactions_between("bank_transactions")
+    bank_df = bank_df[bank_df["my_category"].str.lower() == "savings"]
+    savings_df = ctx.frame("savings").copy()
+    savings_df["txn_timestamp"] = parse_timestamps(savings_df["txn_timestamp"])
+    savings_df["amount"] = pd.to_numeric(savings_df["amount"], errors="coerce")
+    assert bank_df["txn_id"].is_unique, "identical bank rows must get distinct txn_ids"
+    linked = link_legacy_rows(savings_df, bank_df)
+    pending = bank_df[~bank_df["txn_id"].isin(set(savings_df["txn_id"].astype(str)))]
+    return linked, len(pending)
+
+
+def _open_year(ledger):
+    return int(parse_timestamps(pd.Series([row[1] for row in ledger[BANK_SHEET][1:]])).dt.year.max())
+
+
+def archive_closed_years(ledger):
+    # Every year but the newest one in the ledger moves to its own worksheet
+    open_year = _open_year(ledger)
+    moved = 0
+    for name in (BANK_SHEET, "credit_card"):
+        years = parse_timestamps(store.load_frame(name)["txn_timestamp"]).dt.year.dropna().unique()
+        for year in sorted(int(year) for year in years if year < open_year):
+            moved += store.archive_year(name, year, SHEET_URL)["archived"]
+    return moved
+
+
+def load_open_year(ledger):
+    # Partition pruning: only the base worksheet overlaps the newest year
+    return DataContext().transactions_between(BANK_SHEET, start=f"{_open_year(ledger)}-01-01")
+
+
+def load_all_years():
+    return DataContext().transactions_between(BANK_SHEET)
+
+
+# === Runner ===
+def measure(name, fn, trace_memory):
+    local_sheets.stats.update({key: 0 for key in local_sheets.stats})
+    gsheet.scheduler_stats.update({key: 0 for key in gsheet.scheduler_stats})
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - started
+    peak_mb = None
+    if trace_memory:
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        tracemalloc.stop()
+    return {"stage": name, "seconds": round(seconds, 4),
+            "peak_mb": None if peak_mb is None else round(peak_mb, 1),
+            "api_requests": local_sheets.stats["requests"],
+            "cells_read": local_sheets.stats["cells_read"],
+            "retries": gsheet.scheduler_stats["retries"]}
+
+
+def run(rows, years, trace_memory=True):
+    ledger = _reset(rows, years)
+    sizes = {name: len(values) - 1 for name, values in ledger.items()}
+    stages = [
+        ("sync all sheets", lambda: store.sync_all(SHEET_URL)),
+        ("home quick stats", home_quick_stats),
+        ("dashboard budget vs actual", dashboard_budget_vs_actual),
+        ("data uncategorized filter", data_uncategorized),
+        (f"import upload ({IMPORT_ROWS} rows)", lambda: import_upload(ledger)),
+        ("savings reconciliation", savings_reconciliation),
+        ("flush write journal", store.flush_writes),
+        (f"resync after append ({APPENDED_ROWS} rows)", lambda: resync_after_append(ledger)),
+        ("archive closed years", lambda: archive_closed_years(ledger)),
+        ("load open year (pruned)", lambda: load_open_year(ledger)),
+        ("load all years", load_all_years),
+        ("home quick stats (archived)", home_quick_stats),
+    ]
+    results = [measure(name, fn, trace_memory) for name, fn in stages]
+    return {"rows": rows, "years": years, "sheet_rows": sizes, "stages": results}
+
+
+def print_report(report):
+    sizes = ", ".join(f"{name}={count:,}" for name, count in report["sheet_rows"].items())
+    print(f"\n== {report['rows']:,} transactions over {report['years']} years ({sizes})")
+    print(f"{'stage':<32}{'seconds':>10}{'peak MB':>10}{'requests':>10}{'cells read':>12}{'retries':>10}")
+    for stage in report["stages"]:
+        peak = "-" if stage["peak_mb"] is None else f"{stage['peak_mb']:.1f}"
+        print(f"{stage['stage']:<32}{stage['seconds']:>10.3f}{peak:>10}{stage['api_requests']:>10}"
+              f"{stage['cells_read']:>12,}{stage['retries']:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000],
+                        help="bank + credit card transactions to generate (10k to 1M)")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=0, help="simulated latency per Sheets request")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of Sheets requests failing with a 429")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc peak-memory tracking")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    local_sheets.configure(latency_ms=args.latency_ms, error_rate=args.error_rate)
+    reports = []
+    for rows in args.rows:
+        report = run(rows, args.years, trace_memory=not args.no_memory)
+        print_report(report)
+        reports.append(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
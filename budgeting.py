@@ -1,11 +1,9 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
-from utils.gsheet import get_worksheet
-
-# Load Custom CSS
-with open('assets/style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+from utils.store import upsert_rows, RowsMovedError
+from utils.context import get_context
+from utils.timing import timed
 
 # --- Constants ---
 SHEET_URL = "https://docs.google.com/spreadsheets/d/1C2IwUJSB30tbfu1dbR-_PKRVeSePcGq7fpLxMqtTa1w"
@@ -19,11 +17,16 @@ EXPENSE_CATEGORIES = [
     "Shopping", "Leisure","Subscriptions"
 ]
 INCOME_CATEGORIES = ["Freelancing", "Salary"]
+KEY_COLS = ["month_year", "person", "category"]
+
+def month_key(value):
+    ts = pd.to_datetime(value, errors="coerce")
+    return "" if pd.isna(ts) else ts.strftime("%Y-%m")
 
 # --- Load previous month's values ---
+@timed("budgeting: load previous {0}")
 def load_previous_data(sheet_name, key_col):
-    ws = get_worksheet(SHEET_URL, sheet_name)
-    df = pd.DataFrame(ws.get_all_records())
+    df = get_context().frame(sheet_name)
     if df.empty:
         return {}
     df["month_year"] = pd.to_datetime(df["month_year"], errors="coerce").dt.strftime("%Y-%m")
@@ -61,7 +64,8 @@ def show():
     selected_month = st.date_input("Choose a date in the month", datetime.today(), help="Select any date in the month you want to budget for")
     month_year = selected_month.strftime("%Y-%m")
 
-    # Load previous data
+    # Load previous data (both sheets fetched together if out of date)
+    get_context().prefetch(INCOME_SHEET, BUDGET_SHEET)
     preload_income = load_previous_data(INCOME_SHEET, "income")
     preload_budget = load_previous_data(BUDGET_SHEET, "budgeted")
 
@@ -116,15 +120,15 @@ def show():
     with col2:
         if st.button("📤 Submit Income Data", help="Save income data to the spreadsheet"):
             try:
-                income_ws = get_worksheet(SHEET_URL, INCOME_SHEET)
                 df_income = pd.DataFrame(income_inputs)
-                for row in df_income.values.tolist():
-                    income_ws.append_row(row, value_input_option="USER_ENTERED")
-                st.success("✅ Income data submitted successfully!")
+                stats = upsert_rows(INCOME_SHEET, income_inputs, KEY_COLS, {"month_year": month_key}, SHEET_URL)
+                st.success(f"✅ Income data submitted successfully! ({stats['updated']} updated, {stats['inserted']} added)")
                 
                 # Show summary
                 with st.expander("📋 Income Summary"):
                     st.dataframe(df_income, use_container_width=True)
+            except RowsMovedError as e:
+                st.warning(str(e))
             except Exception as e:
                 st.error(f"❌ Error submitting income data: {e}")
 
@@ -198,15 +202,15 @@ def show():
     with col2:
         if st.button("📤 Submit Budget Data", help="Save budget data to the spreadsheet"):
             try:
-                budget_ws = get_worksheet(SHEET_URL, BUDGET_SHEET)
                 df_budget = pd.DataFrame(budget_inputs)
-                for row in df_budget.values.tolist():
-                    budget_ws.append_row(row, value_input_option="USER_ENTERED")
-                st.success("✅ Budget data submitted successfully!")
+                stats = upsert_rows(BUDGET_SHEET, budget_inputs, KEY_COLS, {"month_year": month_key}, SHEET_URL)
+                st.success(f"✅ Budget data submitted successfully! ({stats['updated']} updated, {stats['inserted']} added)")
                 
                 # Show summary
                 with st.expander("📋 Budget Summary"):
                     st.dataframe(df_budget, use_container_width=True)
+            except RowsMovedError as e:
+                st.warning(str(e))
             except Exception as e:
                 st.error(f"❌ Error submitting budget data: {e}")
 
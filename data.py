@@ -1,10 +1,11 @@
 import streamlit as st
 import pandas as pd
-from utils.gsheet import get_worksheet
-
-# Load Custom CSS
-with open('assets/style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+from utils.store import queue_update, archive_year, archived_years, RowsMovedError
+from utils.journal import update_ranges
+from utils.transaction import FINGERPRINT_COLS
+from utils.context import get_context
+from utils.rules import load_rules, categorize
+from utils.timing import stage, timed
 
 # === Sheet Config ===
 SHEET_URL = "https://docs.google.com/spreadsheets/d/1C2IwUJSB30tbfu1dbR-_PKRVeSePcGq7fpLxMqtTa1w"
@@ -19,20 +20,48 @@ CATEGORY_OPTIONS = [
     "Rent", "Savings", "Shopping", "Transport - External",
     "Transport - Internal", "Subscriptions", "Other"
 ]
+PAGE_SIZE = 50  # uncategorized rows rendered per page
 
 # === Load Data ===
 def load_data(sheet_name):
-    worksheet = get_worksheet(SHEET_URL, sheet_name)
-    data = worksheet.get_all_records()
-    df = pd.DataFrame(data)
-    return worksheet, df
+    return get_context().frame(sheet_name)
 
 # === Update Rows ===
-def update_rows(worksheet, df, updated_rows):
-    for index, category in updated_rows.items():
-        row_number = index + 2  # 1 for 0-index, 1 for header row
-        col_index = df.columns.get_loc("my_category") + 1
-        worksheet.update_cell(row_number, col_index, category)
+def update_rows(sheet_key, df, updated_rows):
+    """
+    Queues all my_category updates as one journaled write; the background writer sends them in one batch.
+    Rows are addressed by position, so their identifying columns are checked against the sheet first
+    (raises RowsMovedError if rows were sorted or deleted in Google Sheets since df was loaded).
+    Returns the number of ranges in the batch request (one per run of consecutive rows).
+    """
+    col_index = df.columns.get_loc("my_category") + 1
+    cells = [
+        [index + 2, col_index, category]  # 1 for 0-index, 1 for header row
+        for index, category in updated_rows.items()
+    ]
+    id_cols = [col for col in FINGERPRINT_COLS[sheet_key] if col in df.columns]
+    expected = {index + 2: df.loc[index, id_cols].to_dict() for index in updated_rows}
+    queue_update(sheet_key, cells, SHEET_URL, expected)
+    return len(update_ranges(cells))
+
+def uncategorized_mask(df):
+    return df["my_category"].isna() | (df["my_category"].astype(str).str.strip() == "")
+
+# === Rule-based Categorization ===
+@timed("data: auto-categorize {0}")
+def auto_categorize(sheet_key):
+    """
+    Applies the rules from data/config.json to every uncategorized row and queues the matches as one write.
+    Returns (matched, remaining).
+    """
+    df = load_data(sheet_key)
+    if "my_category" not in df.columns:
+        return 0, len(df)
+    pending = df[uncategorized_mask(df)]
+    matches = categorize(pending, load_rules()).dropna()
+    if not matches.empty:
+        update_rows(sheet_key, df, matches.to_dict())
+    return len(matches), len(pending) - len(matches)
 
 # === Render UI for One Sheet ===
 def render_sheet_categorizer(label, sheet_key):
@@ -41,13 +70,17 @@ def render_sheet_categorizer(label, sheet_key):
         <h2 style='margin-bottom: 0.5rem; color: #667eea;'>🗂️ {label}</h2>
     </div>
     """, unsafe_allow_html=True)
+    saved = st.session_state.pop(f"{sheet_key}_saved", None)  # set before the rerun that follows a save
+    if saved:
+        st.success(saved)
 
-    worksheet, df = load_data(sheet_key)
+    with stage(f"data: uncategorized filter {sheet_key}"):
+        df = load_data(sheet_key)
 
-    if "my_category" not in df.columns:
-        df["my_category"] = ""
+        if "my_category" not in df.columns:
+            df["my_category"] = ""
 
-    df_uncategorized = df[df["my_category"].isna() | (df["my_category"].astype(str).str.strip() == "")]
+        df_uncategorized = df[uncategorized_mask(df)]
 
     if df_uncategorized.empty:
         st.success(f"✅ All {label.lower()} entries are categorized.")
@@ -55,20 +88,103 @@ def render_sheet_categorizer(label, sheet_key):
 
     st.info(f"Found **{len(df_uncategorized)}** uncategorized rows in **{label}**")
 
-    updates = {}
-
-    for idx, row in df_uncategorized.iterrows():
-        title = f"{row.get('date', '')} | ₹{row['amount']} | {row.get('merchant', row.get('category', ''))}"
-        with st.expander(title):
-            st.write(f"**Type:** {row['type']} | **Bank/Card:** {row.get('bank_name', row.get('card_name', 'N/A'))}")
-            selected = st.selectbox("Select Category", CATEGORY_OPTIONS, key=f"{sheet_key}_{idx}")
-            updates[idx] = selected
+    # --- Server-side paging: only one page of rows is ever rendered ---
+    page_key = f"{sheet_key}_page"
+    pages = (len(df_uncategorized) - 1) // PAGE_SIZE + 1
+    page = min(st.session_state.get(page_key, 0), pages - 1)
+    start = page * PAGE_SIZE
+    page_df = df_uncategorized.iloc[start:start + PAGE_SIZE]
+
+    nav_prev, nav_label, nav_next = st.columns([1, 3, 1])
+    with nav_prev:
+        if st.button("◀ Prev", key=f"{sheet_key}_prev", disabled=page == 0):
+            st.session_state[page_key] = page - 1
+            st.rerun()
+    with nav_label:
+        st.caption(f"Page {page + 1} of {pages} · rows {start + 1}–{start + len(page_df)} of {len(df_uncategorized)}")
+    with nav_next:
+        if st.button("Next ▶", key=f"{sheet_key}_next", disabled=page >= pages - 1):
+            st.session_state[page_key] = page + 1
+            st.rerun()
 
-    if st.button(f"💾 Save Categories for {label}"):
-        update_rows(worksheet, df, updates)
-        st.success(f"✅ Updated {len(updates)} rows in **{label}**.")
+    with stage(f"data: render grid {sheet_key}"):
+        detail_col = "merchant" if "merchant" in page_df.columns else "category"
+        account_col = "bank_name" if "bank_name" in page_df.columns else "card_name"
+        grid = pd.DataFrame({
+            "Select": False,
+            "Date": page_df["date"] if "date" in page_df.columns else "",
+            "Amount": page_df["amount"],
+            "Description": page_df[detail_col] if detail_col in page_df.columns else "",
+            "Type": page_df["type"],
+            "Bank/Card": page_df[account_col] if account_col in page_df.columns else "N/A",
+            "Category": None,
+        }, index=page_df.index)
+
+        edited = st.data_editor(
+            grid,
+            key=f"{sheet_key}_editor_{page}",
+            hide_index=True,
+            use_container_width=True,
+            disabled=["Date", "Amount", "Description", "Type", "Bank/Card"],
+            column_config={
+                "Select": st.column_config.CheckboxColumn("Select", help="Include in bulk apply"),
+                "Category": st.column_config.SelectboxColumn("Category", options=CATEGORY_OPTIONS),
+            },
+        )
+
+    # Rows picked one by one in the grid
+    updates = edited["Category"].dropna().to_dict()
+    selected = edited.index[edited["Select"]]
+
+    bulk_col, apply_col, save_col = st.columns([2, 1, 1])
+    with bulk_col:
+        bulk_category = st.selectbox("Category for selected rows", CATEGORY_OPTIONS, key=f"{sheet_key}_bulk")
+    with apply_col:
+        apply_clicked = st.button(f"✅ Apply to {len(selected)} Selected", key=f"{sheet_key}_apply", disabled=len(selected) == 0)
+    with save_col:
+        save_clicked = st.button("💾 Save Page", key=f"{sheet_key}_save", disabled=not updates)
+
+    if apply_clicked:
+        updates.update({idx: bulk_category for idx in selected})
+
+    if (apply_clicked or save_clicked) and updates:
+        try:
+            ranges = update_rows(sheet_key, df, updates)
+        except RowsMovedError as e:
+            st.warning(str(e))
+            return
+        st.session_state[f"{sheet_key}_saved"] = (
+            f"✅ Updated {len(updates)} rows in **{label}** (1 batch request, {ranges} range{'s' if ranges != 1 else ''}; "
+            "saving to Google Sheets in the background)."
+        )
         st.rerun()
 
+# === Archive Closed Years ===
+def render_archive():
+    """
+    Moves a past year of both sheets into their year worksheets (e.g. bank_transactions_2023).
+    """
+    with st.expander("🗄️ Archive Closed Years"):
+        st.caption("Archived years keep counting in the dashboard, balances and savings; "
+                   "this page and recent transactions only load the open years.")
+        # Years come from the monthly cube (all partitions); those archived for every sheet are left out
+        this_year = pd.Timestamp.now().year
+        months = get_context().cube()["month"]
+        years = {int(month[:4]) for month in months.unique() if month}
+        done = set.intersection(*(set(archived_years(key, SHEET_URL)) for key in SHEETS.values()))
+        closed = sorted((year for year in years - done if year < this_year), reverse=True)
+        if not closed:
+            st.info("ℹ️ No closed years left to archive.")
+            return
+        year = st.selectbox("Year", closed, key="archive_year")
+        if st.button("🗄️ Archive Year", help="Moves every transaction of this year into its own worksheet"):
+            for label, key in SHEETS.items():
+                try:
+                    result = archive_year(key, year, SHEET_URL)
+                    st.success(f"✅ {label}: moved {result['archived']} rows to `{result['partition']}`.")
+                except Exception as e:
+                    st.error(f"❌ Archiving {label} failed: {e}")
+
 # === Entry Point ===
 def show():
     # Header with back button
@@ -86,9 +202,20 @@ def show():
         </div>
         """, unsafe_allow_html=True)
 
+    if st.button("🤖 Auto-categorize with Rules", help="Apply the categorization rules from data/config.json"):
+        try:
+            for label, key in SHEETS.items():
+                matched, remaining = auto_categorize(key)
+                st.success(f"✅ {label}: categorized {matched} rows, {remaining} left for review.")
+        except Exception as e:
+            st.error(f"❌ Auto-categorization failed: {e}")
+
+    get_context().prefetch(*SHEETS.values())
     for label, key in SHEETS.items():
         render_sheet_categorizer(label, key)
 
+    render_archive()
+
     # Tips Section
     st.markdown("### 💡 Categorization Tips")
     st.markdown("""
@@ -1,10 +1,10 @@
 import streamlit as st
 import pandas as pd
-from budgeting import show as show_budgeting
-from import_ import show as show_import
-from home_dashboard import show as show_dashboard
-from data import show as show_data
-from utils.gsheet import get_worksheet
+from utils.store import sync_all, queue_append, write_status, retry_writes, discard_writes
+from utils.journal import render_status as render_write_status
+from utils.context import new_context
+from utils.timing import start_run, finish_run, stage, render_panel
+from utils.assets import inject_css
 
 # --- App Configuration ---
 st.set_page_config(
@@ -13,14 +13,17 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# --- Load Custom CSS ---
-with open('assets/style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+# --- Load Custom CSS (once for every page) ---
+inject_css()
 
 # --- Session State Setup ---
 if "page" not in st.session_state:
     st.session_state.page = "home"
 
+# One data context per rerun: each sheet is loaded and parsed at most once
+ctx = new_context()
+start_run(st.session_state.page)
+
 def navigate_to(page_name):
     st.session_state.page = page_name
     st.experimental_rerun()
@@ -76,32 +79,30 @@ if st.session_state.page == "home":
     st.markdown("### 📊 Quick Overview")
     
     SHEET_URL = "https://docs.google.com/spreadsheets/d/1C2IwUJSB30tbfu1dbR-_PKRVeSePcGq7fpLxMqtTa1w"
+    if st.button("🔄 Sync with Google Sheets", help="Refresh the local copy of all sheets"):
+        try:
+            sync_all(SHEET_URL)
+            st.success("✅ Local data synced.")
+        except Exception as e:
+            st.error(f"❌ Sync failed: {e}")
+
+    ctx.prefetch("bank_transactions", "credit_card", "savings")
+
     try:
-        @st.cache_data(ttl=60)
-        def get_sheet_data(sheet_url, worksheet_name):
-            ws = get_worksheet(sheet_url, worksheet_name)
-            return ws.get_all_records()
+        with stage("home: quick stats"):
+            cube = ctx.cube()
 
-        bank_df = pd.DataFrame(get_sheet_data(SHEET_URL, "bank_transactions"))
-        credit_df = pd.DataFrame(get_sheet_data(SHEET_URL, "credit_card"))
+            # Balance of the account with the most recent transaction, from the balance index
+            balances = ctx.latest_balances()
+            latest_balance = balances["balance"].iloc[0] if not balances.empty else 0
 
-        if not bank_df.empty:
-            bank_df["txn_timestamp"] = pd.to_datetime(bank_df["txn_timestamp"], errors="coerce")
-            bank_df["amount"] = pd.to_numeric(bank_df["amount"], errors="coerce")
-            latest_balance = bank_df["current_balance"].dropna().iloc[-1] if "current_balance" in bank_df.columns else 0
-            monthly_expenses = bank_df[
-                (bank_df["type"].str.upper() == "DEBIT") & 
-                (bank_df["txn_timestamp"].dt.month == pd.Timestamp.now().month)
+            # Expense totals come from the monthly aggregate cube, not the raw rows
+            debits = cube[cube["type"] == "DEBIT"]
+            monthly_expenses = debits[
+                (debits["source"] == "bank") &
+                (debits["month"] == pd.Timestamp.now().strftime("%Y-%m"))
             ]["amount"].sum()
-        else:
-            latest_balance = 0
-            monthly_expenses = 0
-
-        if not credit_df.empty:
-            credit_df["amount"] = pd.to_numeric(credit_df["amount"], errors="coerce")
-            credit_expenses = credit_df[credit_df["type"] == "DEBIT"]["amount"].sum()
-        else:
-            credit_expenses = 0
+            credit_expenses = debits[debits["source"] == "credit"]["amount"].sum()
 
         # Quick Stats Cards
         col1, col2, col3 = st.columns(3)
@@ -136,18 +137,16 @@ if st.session_state.page == "home":
     st.markdown("### 🧾 Recent Transactions")
     
     try:
-        bank_df = pd.DataFrame(get_sheet_data(SHEET_URL, "bank_transactions"))
-        credit_df = pd.DataFrame(get_sheet_data(SHEET_URL, "credit_card"))
+        with stage("home: recent transactions"):
+            bank_df = ctx.transactions("bank_transactions")
+            credit_df = ctx.transactions("credit_card")
 
-        bank_df["txn_timestamp"] = pd.to_datetime(bank_df["txn_timestamp"], errors="coerce")
-        credit_df["txn_timestamp"] = pd.to_datetime(credit_df["txn_timestamp"], errors="coerce")
+            bank_df["source"] = "🏦 Bank"
+            credit_df["source"] = "💳 Credit"
 
-        bank_df["source"] = "🏦 Bank"
-        credit_df["source"] = "💳 Credit"
-
-        combined_df = pd.concat([bank_df, credit_df], ignore_index=True)
-        combined_df = combined_df.sort_values(by="txn_timestamp", ascending=False).dropna(subset=["txn_timestamp"])
-        recent_txns = combined_df.head(7)
+            combined_df = pd.concat([bank_df, credit_df], ignore_index=True)
+            combined_df = combined_df.sort_values(by="txn_timestamp", ascending=False).dropna(subset=["txn_timestamp"])
+            recent_txns = combined_df.head(7)
 
         if not recent_txns.empty:
             for _, row in recent_txns.iterrows():
@@ -184,8 +183,9 @@ if st.session_state.page == "home":
     # --- 3-Year Savings Plan Tracker ---
     st.markdown("### 🎯 3-Year Savings Plan")
     try:
-        savings_df = pd.DataFrame(get_sheet_data(SHEET_URL, "savings"))
-        savings_df["amount"] = pd.to_numeric(savings_df["amount"], errors="coerce")
+        with stage("home: savings plan"):
+            savings_df = ctx.frame("savings")
+            savings_df["amount"] = pd.to_numeric(savings_df["amount"], errors="coerce")
 
         savings_goals = {
             "Wedding Plan": 1000000,
@@ -268,9 +268,8 @@ if st.session_state.page == "home":
                     account_number, dt_str, amount, current_balance, txn_type, reference, merchant,
                     category_icon_name, category, bank_name, notes, person, date_str, time_str, my_category
                 ]
-                ws = get_worksheet(SHEET_URL, "bank_transactions")
-                ws.append_row(row, value_input_option="USER_ENTERED")
-                st.success("✅ Transaction added successfully!")
+                queue_append("bank_transactions", [row], SHEET_URL)
+                st.success("✅ Transaction added! It is being saved to Google Sheets in the background.")
         else:
             card_number = st.text_input("Card Number")
             card_name = st.selectbox("Card Name", ["Paytm", "HDFC"])
@@ -288,18 +287,26 @@ if st.session_state.page == "home":
                     card_number, card_name, dt_str, amount, txn_type, merchant,
                     category_icon_name, category, notes, person, date_str, time_str, my_category
                 ]
-                ws = get_worksheet(SHEET_URL, "credit_card")
-                ws.append_row(row, value_input_option="USER_ENTERED")
-                st.success("✅ Transaction added successfully!")
+                queue_append("credit_card", [row], SHEET_URL)
+                st.success("✅ Transaction added! It is being saved to Google Sheets in the background.")
 
+# Pages are imported on first navigation, so the home page never pays for them
 elif st.session_state.page == "dashboard":
+    from home_dashboard import show as show_dashboard
     show_dashboard()
 elif st.session_state.page == "budgeting":
+    from budgeting import show as show_budgeting
     show_budgeting()
 elif st.session_state.page == "import":
+    from import_ import show as show_import
     show_import()
 elif st.session_state.page == "data":
+    from data import show as show_data
     show_data()
 elif st.session_state.page == "savings":
     from pages.savings import show as show_savings
     show_savings()
+
+render_write_status(write_status(), retry_writes, discard_writes)
+st.caption(ctx.summary())
+render_panel(finish_run())
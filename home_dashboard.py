@@ -1,13 +1,9 @@
 import streamlit as st
 import pandas as pd
-from utils.gsheet import get_worksheet
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-
-# Load Custom CSS
-with open('assets/style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+from utils.context import get_context
+from utils.timing import stage
+from utils.charts import category_specs, trend_spec, net_worth_spec, to_figure
+from utils.budget import compute, select, totals
 
 def show():
     # Header with back button
@@ -28,10 +24,11 @@ def show():
     SHEET_URL = "https://docs.google.com/spreadsheets/d/1C2IwUJSB30tbfu1dbR-_PKRVeSePcGq7fpLxMqtTa1w"
 
     # --- Load Data ---
+    ctx = get_context()
+
     def safe_get_df(sheet_name):
         try:
-            ws = get_worksheet(SHEET_URL, sheet_name)
-            df = pd.DataFrame(ws.get_all_records())
+            df = ctx.frame(sheet_name)
             if df.empty:
                 st.warning(f"⚠️ No data found in `{sheet_name}` sheet.")
             return df
@@ -39,43 +36,44 @@ def show():
             st.error(f"❌ Failed to load `{sheet_name}`: {e}")
             return pd.DataFrame()
 
-    bank_df = safe_get_df("bank_transactions")
-    credit_df = safe_get_df("credit_card")
-    budget_df = safe_get_df("budget")
+    with stage("dashboard: load sheets"):
+        ctx.prefetch("bank_transactions", "credit_card", "budget")
+        # Raw frames are enough: they are only validated here, figures come from the cube and balance index
+        bank_df = safe_get_df("bank_transactions")
+        credit_df = safe_get_df("credit_card")
+        budget_df = safe_get_df("budget")
 
     # --- Validation ---
     if "txn_timestamp" not in bank_df.columns or "txn_timestamp" not in credit_df.columns:
         st.error("Missing `txn_timestamp` in bank or credit sheet. Please ensure correct headers.")
         return
 
-    # --- Clean & Transform ---
-    bank_df["txn_timestamp"] = pd.to_datetime(bank_df["txn_timestamp"], errors="coerce")
-    bank_df["amount"] = pd.to_numeric(bank_df["amount"], errors="coerce")
-    bank_df["current_balance"] = pd.to_numeric(bank_df["current_balance"], errors="coerce")
-
-    credit_df["txn_timestamp"] = pd.to_datetime(credit_df["txn_timestamp"], errors="coerce")
-    credit_df["amount"] = pd.to_numeric(credit_df["amount"], errors="coerce")
-    credit_df["type"] = credit_df["type"].str.upper()
-
-    budget_df["budgeted"] = pd.to_numeric(budget_df["budgeted"], errors="coerce")
-    budget_df["month_year"] = pd.to_datetime(budget_df["month_year"], errors="coerce").dt.to_period("M")
+    # Spending figures below are read from the monthly aggregate cube
+    try:
+        cube = ctx.cube()
+    except Exception as e:
+        st.error(f"❌ Failed to load monthly aggregates: {e}")
+        return
+    bank_debits = cube[(cube["source"] == "bank") & (cube["type"] == "DEBIT")]
 
     # --- KPI Cards ---
-    if not bank_df.empty and "current_balance" in bank_df.columns:
-        latest_balances = bank_df.dropna(subset=["current_balance"]).groupby("account_number")["current_balance"].last()
-        net_worth = latest_balances.sum()
-        latest_balance = bank_df["current_balance"].dropna().iloc[-1] if not bank_df["current_balance"].dropna().empty else 0
-    else:
-        net_worth, latest_balance = 0, 0
+    with stage("dashboard: KPIs"):
+        # Balances come from the balance index (each account ordered by timestamp, not sheet row)
+        try:
+            balances = ctx.latest_balances()
+        except Exception as e:
+            st.error(f"❌ Failed to load account balances: {e}")
+            return
+        if not balances.empty:
+            net_worth = balances["balance"].sum()
+            latest_balance = balances["balance"].iloc[0]
+        else:
+            net_worth, latest_balance = 0, 0
 
-    debits = bank_df[bank_df["type"].str.upper() == "DEBIT"] if not bank_df.empty else pd.DataFrame()
-    if not debits.empty:
-        debits["month"] = debits["txn_timestamp"].dt.to_period("M")
-        avg_monthly_expense = debits.groupby("month")["amount"].sum().mean()
-    else:
-        avg_monthly_expense = 0
+        dated_debits = bank_debits[bank_debits["month"] != ""]
+        avg_monthly_expense = dated_debits.groupby("month")["amount"].sum().mean() if not dated_debits.empty else 0
 
-    cc_expense_total = credit_df[credit_df["type"] == "DEBIT"]["amount"].sum() if not credit_df.empty else 0
+        cc_expense_total = cube[(cube["source"] == "credit") & (cube["type"] == "DEBIT")]["amount"].sum()
 
     # Enhanced KPI Cards
     st.markdown("### 📈 Key Financial Metrics")
@@ -123,128 +121,67 @@ def show():
         st.warning("⏳ No budget data available.")
         return
     
+    # Budget vs actual for every month and person, recomputed only when the data changes
+    with stage("dashboard: budget vs actual"):
+        table, budget_months = compute(ctx.version("budget", "bank_transactions", "credit_card"), budget_df, cube)
+
     selected_month = filter_col2.selectbox(
         "📅 Select Month",
-        sorted(budget_df["month_year"].astype(str).unique())[::-1]
+        budget_months
     )
 
-    # --- Budget vs Actual Table ---
-    filtered_budget = budget_df.copy()
-    if selected_person != "All":
-        filtered_budget = filtered_budget[filtered_budget["person"] == selected_person]
-    filtered_budget = filtered_budget[filtered_budget["month_year"].astype(str) == selected_month]
-
-    # Filter bank transactions for selected person, month, and DEBIT type
-    filtered_bank = bank_df.copy()
-    if selected_person != "All":
-        filtered_bank = filtered_bank[filtered_bank["person"] == selected_person]
-    filtered_bank = filtered_bank[(filtered_bank["txn_timestamp"].dt.to_period("M").astype(str) == selected_month) & (filtered_bank["type"].str.upper() == "DEBIT")]
-    # Standardize and filter my_category
-    filtered_bank = filtered_bank[filtered_bank["my_category"].notna() & (filtered_bank["my_category"].str.strip() != "")].copy()
-    filtered_bank["my_category"] = filtered_bank["my_category"].str.strip().str.lower()
-
-    # Group by my_category and sum amount
-    actuals_per_cat = filtered_bank.groupby("my_category")["amount"].sum().reset_index()
-    actuals_per_cat.columns = ["Category", "Spent"]
-    actuals_per_cat["Category"] = actuals_per_cat["Category"].str.strip().str.lower()
-
-    # Group budget by category (standardize)
-    budget_per_cat = filtered_budget.copy()
-    budget_per_cat["category"] = budget_per_cat["category"].str.strip().str.lower()
-    budget_per_cat = budget_per_cat.groupby("category")["budgeted"].sum().reset_index()
-    budget_per_cat.columns = ["Category", "Budgeted"]
-    budget_per_cat["Category"] = budget_per_cat["Category"].str.strip().str.lower()
-
-    # Merge on Category
-    merged = pd.merge(budget_per_cat, actuals_per_cat, on="Category", how="outer").fillna(0)
-    merged["% Used"] = (merged["Spent"] / merged["Budgeted"] * 100).round(2)
-    merged["% Used"] = merged["% Used"].replace([float("inf"), -float("inf")], 0)
-
-    # Format columns to two decimal places
-    merged["Budgeted"] = merged["Budgeted"].map(lambda x: f"{x:,.2f}")
-    merged["Spent"] = merged["Spent"].map(lambda x: f"{x:,.2f}")
-    merged["% Used"] = merged["% Used"].map(lambda x: f"{x:.2f}")
+    # --- Budget vs Actual Table (bank + credit card debits) ---
+    with stage("dashboard: budget selection"):
+        selection = select(table, selected_month, selected_person)
+        actuals_per_cat = selection.loc[selection["spent"] != 0, ["category", "spent"]]
+        actuals_per_cat.columns = ["Category", "Spent"]
+        merged = selection.rename(columns={
+            "category": "Category", "budgeted": "Budgeted", "bank_spent": "Bank",
+            "credit_spent": "Credit Card", "spent": "Spent", "used_pct": "% Used"
+        })
 
     st.markdown("#### 📋 Budget vs Actual Comparison")
-    st.dataframe(merged, use_container_width=True)
+    money = "{:,.2f}"
+    st.dataframe(
+        merged.style.format({"Budgeted": money, "Bank": money, "Credit Card": money, "Spent": money, "% Used": "{:.2f}"}),
+        use_container_width=True
+    )
     st.markdown("#### (Debug) Actuals Per Category")
-    st.dataframe(actuals_per_cat, use_container_width=True)
-
-    # --- Charts Section ---
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        if not actuals_per_cat.empty:
-            # Enhanced Pie Chart
-            fig_pie = px.pie(
-                actuals_per_cat, 
-                names="Category", 
-                values="Spent", 
-                title="🧁 Category-wise Spending Breakdown",
-                color_discrete_sequence=px.colors.qualitative.Set3
-            )
-            fig_pie.update_traces(textposition='inside', textinfo='percent+label')
-            fig_pie.update_layout(
-                title_x=0.5,
-                title_font_size=16,
-                showlegend=True,
-                height=400
-            )
-            st.plotly_chart(fig_pie, use_container_width=True)
+    st.dataframe(actuals_per_cat.style.format({"Spent": money}), use_container_width=True)
 
-    with col2:
+    # --- Charts Section (figures cached per person, month and data version) ---
+    version = ctx.version("bank_transactions", "credit_card")
+    with stage("dashboard: category charts"):
+        col1, col2 = st.columns(2)
         if not actuals_per_cat.empty:
-            # Enhanced Bar Chart for Top Categories
-            top_categories = actuals_per_cat.nlargest(8, 'Spent')
-            fig_bar = px.bar(
-                top_categories,
-                x='Spent',
-                y='Category',
-                orientation='h',
-                title="📊 Top Spending Categories",
-                color='Spent',
-                color_continuous_scale='viridis'
-            )
-            fig_bar.update_layout(
-                title_x=0.5,
-                title_font_size=16,
-                height=400,
-                xaxis_title="Amount (₹)",
-                yaxis_title="Category"
-            )
-            st.plotly_chart(fig_bar, use_container_width=True)
-
-    # --- Monthly Trend Chart ---
-    if not filtered_bank.empty:
-        st.markdown("#### 📈 Monthly Spending Trend")
-        trend_data = filtered_bank.copy()
-        trend_data["month_year"] = trend_data["txn_timestamp"].dt.to_period("M").astype(str)
-        trend_chart = trend_data.groupby("month_year")["amount"].sum().reset_index()
-
-        fig_line = px.line(
-            trend_chart,
-            x="month_year",
-            y="amount",
-            title="📈 Monthly Spending Trend",
-            markers=True
-        )
-        fig_line.update_layout(
-            title_x=0.5,
-            title_font_size=16,
-            height=400,
-            xaxis_title="Month",
-            yaxis_title="Total Amount (₹)"
-        )
-        fig_line.update_traces(line_color='#667eea', marker_color='#667eea')
-        st.plotly_chart(fig_line, use_container_width=True)
+            specs = category_specs(selected_person, selected_month, version, actuals_per_cat)
+            with col1:
+                st.plotly_chart(to_figure(specs["pie"]), use_container_width=True)
+            with col2:
+                st.plotly_chart(to_figure(specs["bar"]), use_container_width=True)
+
+    # --- Monthly Trend Chart (the months up to the selected one, bank + credit card, from the aggregate cube) ---
+    with stage("dashboard: trend chart"):
+        trend_debits = cube[(cube["type"] == "DEBIT") & (cube["my_category"] != "")]
+        if selected_person != "All":
+            trend_debits = trend_debits[trend_debits["person"] == selected_person]
+        if not trend_debits.empty:
+            st.markdown("#### 📈 Monthly Spending Trend")
+            spec = trend_spec(selected_person, selected_month, version, trend_debits)
+            st.plotly_chart(to_figure(spec), use_container_width=True)
+
+    # --- Net Worth Chart (month-end balances of all accounts, from the balance index) ---
+    with stage("dashboard: net worth chart"):
+        net_worth_series = ctx.net_worth("M")
+        if not net_worth_series.empty:
+            st.markdown("#### 🏦 Net Worth Over Time")
+            spec = net_worth_spec(ctx.version("bank_transactions"), net_worth_series)
+            st.plotly_chart(to_figure(spec), use_container_width=True)
 
     # --- Summary Cards ---
-    if not merged.empty:
+    if not selection.empty:
         st.markdown("#### 📊 Budget Summary")
-        # Convert columns back to float for calculations
-        total_budgeted = merged["Budgeted"].replace(',', '', regex=True).astype(float).sum()
-        total_spent = merged["Spent"].replace(',', '', regex=True).astype(float).sum()
-        overall_usage = (total_spent / total_budgeted * 100) if total_budgeted > 0 else 0
+        total_budgeted, total_spent, overall_usage = totals(selection)
         
         col1, col2, col3 = st.columns(3)
         
@@ -1,16 +1,34 @@
+import io
+import hashlib
+import warnings
 import streamlit as st
 import pandas as pd
-from utils.gsheet import get_worksheet
+from utils.store import (
+    queue_append, sync_partitions, get_checkpoint, save_checkpoint, clear_checkpoint,
+    known_fingerprints
+)
+from utils.transaction import row_fingerprint
+from utils.timing import timed
+from collections import Counter
 from datetime import datetime
 
-# Load Custom CSS
-with open('assets/style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
-
 # === Constants ===
 SHEET_URL = "https://docs.google.com/spreadsheets/d/1C2IwUJSB30tbfu1dbR-_PKRVeSePcGq7fpLxMqtTa1w"
 BANK_SHEET = "bank_transactions"
 CC_SHEET = "credit_card"
+ISO_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+CHUNK_ROWS = 500     # rows read and journaled per chunk
+PREVIEW_ROWS = 200
+
+# === Expected Export Columns ===
+BANK_COLS = [
+    'account_number', 'txn_timestamp', 'amount', 'current_balance', 'type',
+    'reference', 'merchant', 'category_icon_name', 'category', 'bank_name', 'notes'
+]
+CC_COLS = [
+    'card_number', 'card_name', 'txn_timestamp', 'amount', 'type',
+    'merchant', 'category_icon_name', 'category', 'notes'
+]
 
 # === Helper ===
 def validate_columns(df: pd.DataFrame, expected_cols: list) -> bool:
@@ -18,16 +36,143 @@ def validate_columns(df: pd.DataFrame, expected_cols: list) -> bool:
     expected = [col.strip().lower() for col in expected_cols]
     return df_cols[:len(expected)] == expected
 
-def split_timestamp(ts):
-    try:
-        dt = pd.to_datetime(ts)
-        return dt.date().isoformat(), dt.time().strftime("%H:%M:%S")
-    except:
-        return "", ""
+def drop_repeated_headers(chunk: pd.DataFrame) -> pd.DataFrame:
+    # Some exports repeat the header line as a first data row
+    names = [str(col).strip().lower() for col in chunk.columns]
+    cells = chunk.astype(str).apply(lambda col: col.str.strip().str.lower())
+    return chunk[~(cells == names).all(axis=1)]
+
+def _date_time_strings(parsed):
+    if not pd.api.types.is_datetime64_any_dtype(parsed):
+        # Mixed UTC offsets come back as objects; keep each value's own wall-clock time
+        dates = parsed.map(lambda dt: dt.strftime("%Y-%m-%d") if not pd.isna(dt) else "")
+        times = parsed.map(lambda dt: dt.strftime("%H:%M:%S") if not pd.isna(dt) else "")
+        return dates.astype("string"), times.astype("string")
+    return parsed.dt.strftime("%Y-%m-%d").fillna(""), parsed.dt.strftime("%H:%M:%S").fillna("")
+
+def split_timestamps(series: pd.Series):
+    """
+    Parses a whole txn_timestamp column at once into date and time strings.
+    Values in the export's ISO format (2024-01-31T18:30:00Z) take a fixed-format fast path;
+    the rest fall back to mixed-format parsing. Returns (dates, times, errors) where errors
+    is a DataFrame of the CSV line and raw value for every timestamp that could not be parsed.
+    """
+    raw = series.astype("string").str.strip()
+    parsed = pd.to_datetime(raw, format=ISO_TIMESTAMP_FORMAT, errors="coerce")
+    dates, times = _date_time_strings(parsed)
+
+    pending = parsed.isna() & raw.notna() & (raw != "")
+    if pending.any():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # mixed-offset warnings; handled in _date_time_strings
+            fallback = pd.to_datetime(raw[pending], format="mixed", errors="coerce")
+        dates[pending], times[pending] = _date_time_strings(fallback)
+
+    failed = (dates == "")
+    errors = pd.DataFrame({
+        "csv_line": series.index[failed] + 2,  # 1 for header row, 1 for 1-indexing
+        "txn_timestamp": series[failed].values
+    })
+    return dates, times, errors
+
+def report_timestamp_errors(errors: pd.DataFrame):
+    if errors.empty:
+        return
+    st.warning(f"⚠️ {len(errors)} rows have an unreadable `txn_timestamp`; their date and time were left blank.")
+    with st.expander("🕒 Unparsed Timestamps"):
+        st.dataframe(errors, use_container_width=True, hide_index=True)
 
 def convert_row(row):
     return [str(item) if not pd.isna(item) else "" for item in row]
 
+def upload_id(data: bytes, sheet_name: str, person: str) -> str:
+    return hashlib.sha1(f"{sheet_name}|{person}|".encode("utf-8") + data).hexdigest()
+
+@timed("import: upload {2}")
+def import_statement(uploaded_file, expected_cols: list, sheet_name: str, person: str, label: str):
+    """
+    Streams an uploaded statement into the worksheet CHUNK_ROWS rows at a time.
+    Each chunk is committed to the write journal (the background writer sends it to
+    Google Sheets) and then checkpointed, so re-uploading the same file after a failure
+    resumes from the first uncommitted chunk instead of starting over.
+    """
+    data = uploaded_file.getvalue()
+    import_id = upload_id(data, sheet_name, person)
+    checkpoint = get_checkpoint(import_id)
+
+    if checkpoint and checkpoint["done"]:
+        st.info(f"ℹ️ This {label} file was already imported ({checkpoint['rows_committed']} rows).")
+        if st.button("🔁 Import Again", key=f"reimport_{sheet_name}", help="Forget the previous import of this file"):
+            clear_checkpoint(import_id)
+            st.rerun()
+        return
+
+    chunks_done = checkpoint["chunks_committed"] if checkpoint else 0
+    rows_done = checkpoint["rows_committed"] if checkpoint else 0
+    if chunks_done:
+        st.info(f"⏩ Resuming previous import at chunk {chunks_done + 1} ({rows_done} rows already uploaded).")
+
+    sync_partitions(sheet_name, sheet_url=SHEET_URL)  # refresh the fingerprint index (archived years too) before deduplicating
+
+    total_lines = max(data.count(b"\n"), 1)
+    progress = st.progress(0.0, text=f"Uploading to '{sheet_name}'...")
+    chunk_no = -1
+    preview, ts_errors = [], []
+    skipped = 0
+    occurrences = Counter()  # copies of each transaction seen so far in this file
+
+    for chunk_no, chunk in enumerate(pd.read_csv(io.BytesIO(data), chunksize=CHUNK_ROWS)):
+        if chunk_no == 0 and not validate_columns(chunk, expected_cols):
+            progress.empty()
+            st.error(f"❌ Uploaded {label} CSV must match expected column schema.")
+            st.markdown(f"**Expected:** `{', '.join(expected_cols)}`")
+            st.markdown(f"**Got:** `{', '.join(chunk.columns)}`")
+            return
+        chunk = drop_repeated_headers(chunk)
+        fingerprints = [row_fingerprint(sheet_name, rec) for rec in chunk.to_dict("records")]
+        if chunk_no < chunks_done:
+            occurrences.update(fingerprints)
+            continue
+
+        chunk = chunk.copy()
+        chunk["person"] = person
+        chunk["date"], chunk["time"], errors = split_timestamps(chunk["txn_timestamp"])
+        final_chunk = chunk[expected_cols + ["person", "date", "time"]]
+
+        # --- Skip rows already in the sheet ---
+        # The n-th copy of a transaction in this file is new only while the sheet holds fewer
+        # than n, so identical charges are kept and re-imports skip as many as are there.
+        # Rows queued by earlier chunks are counted too (the journal updates the index).
+        in_sheet = known_fingerprints(sheet_name, fingerprints)
+        keep = []
+        for fp in fingerprints:
+            occurrences[fp] += 1
+            keep.append(in_sheet[fp] < occurrences[fp])
+        skipped += keep.count(False)
+        final_chunk = final_chunk[keep]
+
+        if not final_chunk.empty:
+            queue_append(sheet_name, [convert_row(row) for row in final_chunk.values.tolist()], SHEET_URL)
+        rows_done += len(final_chunk)
+        save_checkpoint(import_id, sheet_name, chunk_no + 1, rows_done)
+
+        if sum(len(p) for p in preview) < PREVIEW_ROWS:
+            preview.append(final_chunk.head(PREVIEW_ROWS))
+        ts_errors.append(errors)
+        progress.progress(min((chunk_no + 1) * CHUNK_ROWS / total_lines, 1.0),
+                          text=f"Uploaded {rows_done} rows to '{sheet_name}'...")
+
+    save_checkpoint(import_id, sheet_name, chunk_no + 1, rows_done, done=True)
+    progress.empty()
+    st.success(f"✅ Uploaded {rows_done} rows to '{sheet_name}' (saving to Google Sheets in the background).")
+    if skipped:
+        st.info(f"⏭️ Skipped {skipped} rows that were already imported.")
+    if preview:
+        with st.expander("📋 Uploaded Data Preview"):
+            st.dataframe(pd.concat(preview).head(PREVIEW_ROWS), use_container_width=True)
+    if ts_errors:
+        report_timestamp_errors(pd.concat(ts_errors, ignore_index=True))
+
 def show():
     # Header with back button
     col1, col2 = st.columns([1, 4])
@@ -48,31 +193,12 @@ def show():
     st.markdown("### 🏦 Upload Bank Statement")
     person = st.selectbox("Who's Data?", ["Divyaraj", "Nithya"], key="person_upload")
     bank_file = st.file_uploader("Upload bank statement CSV", type=["csv"], key="bank_upload")
-    bank_cols = [
-        'account_number', 'txn_timestamp', 'amount', 'current_balance', 'type',
-        'reference', 'merchant', 'category_icon_name', 'category', 'bank_name', 'notes'
-    ]
 
     if bank_file:
         try:
-            df = pd.read_csv(bank_file)
-            if not validate_columns(df, bank_cols):
-                st.error("❌ Uploaded Bank CSV must match expected column schema.")
-                st.markdown(f"**Expected:** `{', '.join(bank_cols)}`")
-                st.markdown(f"**Got:** `{', '.join(df.columns)}`")
-            else:
-                df = df.iloc[1:]  # skip header row if included twice
-                df["person"] = person
-                df["date"], df["time"] = zip(*df["txn_timestamp"].apply(split_timestamp))
-                final_data = df[bank_cols + ["person", "date", "time"]]
-                worksheet = get_worksheet(SHEET_URL, BANK_SHEET)
-                worksheet.append_rows([convert_row(row) for row in final_data.values.tolist()],
-                                      value_input_option="USER_ENTERED")
-                st.success(f"✅ Uploaded {len(final_data)} rows to '{BANK_SHEET}'.")
-                with st.expander("📋 Uploaded Data Preview"):
-                    st.dataframe(final_data, use_container_width=True)
+            import_statement(bank_file, BANK_COLS, BANK_SHEET, person, "Bank")
         except Exception as e:
-            st.error(f"❌ Error uploading bank statement: {e}")
+            st.error(f"❌ Error uploading bank statement: {e}. Progress was saved; re-upload the same file to resume.")
         # Center the upload button (if you want a manual upload button, place it here)
         # col1, col2, col3 = st.columns([1,1,1])
         # with col2:
@@ -83,31 +209,12 @@ def show():
     # --- Credit Card Statement Upload ---
     st.markdown("### 💳 Upload Credit Card Statement")
     cc_file = st.file_uploader("Upload credit card CSV", type=["csv"], key="cc_upload")
-    cc_cols = [
-        'card_number', 'card_name', 'txn_timestamp', 'amount', 'type',
-        'merchant', 'category_icon_name', 'category', 'notes'
-    ]
 
     if cc_file:
         try:
-            df = pd.read_csv(cc_file)
-            if not validate_columns(df, cc_cols):
-                st.error("❌ Uploaded Credit Card CSV must match expected column schema.")
-                st.markdown(f"**Expected:** `{', '.join(cc_cols)}`")
-                st.markdown(f"**Got:** `{', '.join(df.columns)}`")
-            else:
-                df = df.iloc[1:]
-                df["person"] = person
-                df["date"], df["time"] = zip(*df["txn_timestamp"].apply(split_timestamp))
-                final_data = df[cc_cols + ["person", "date", "time"]]
-                worksheet = get_worksheet(SHEET_URL, CC_SHEET)
-                worksheet.append_rows([convert_row(row) for row in final_data.values.tolist()],
-                                      value_input_option="USER_ENTERED")
-                st.success(f"✅ Uploaded {len(final_data)} rows to '{CC_SHEET}'.")
-                with st.expander("📋 Uploaded Data Preview"):
-                    st.dataframe(final_data, use_container_width=True)
+            import_statement(cc_file, CC_COLS, CC_SHEET, person, "Credit Card")
         except Exception as e:
-            st.error(f"❌ Error uploading credit card statement: {e}")
+            st.error(f"❌ Error uploading credit card statement: {e}. Progress was saved; re-upload the same file to resume.")
         # Center the upload button (if you want a manual upload button, place it here)
         # col1, col2, col3 = st.columns([1,1,1])
         # with col2:
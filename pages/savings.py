@@ -1,10 +1,10 @@
 import streamlit as st
 import pandas as pd
-from utils.gsheet import get_worksheet, update_worksheet_rows
-
-# Load Custom CSS
-with open('assets/style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+from utils.gsheet import ensure_column, get_header
+from utils.store import queue_append, queue_update, mark_stale, RowsMovedError
+from utils.transaction import parse_timestamps
+from utils.context import get_context
+from utils.timing import stage
 
 # --- Sheet Config ---
 SHEET_URL = "https://docs.google.com/spreadsheets/d/1C2IwUJSB30tbfu1dbR-_PKRVeSePcGq7fpLxMqtTa1w"
@@ -21,6 +21,55 @@ GOAL_OPTIONS = [
     "Emergency Fund"
 ]
 
+def txn_id_column():
+    """
+    Returns the 1-based index of the txn_id column, adding it first if missing. The header
+    is written to Sheets directly, so the mirror is then reloaded in full.
+    """
+    missing = "txn_id" not in get_header(SHEET_URL, SAVINGS_SHEET)
+    col_index = ensure_column(SHEET_URL, SAVINGS_SHEET, "txn_id")
+    if missing:
+        mark_stale(SAVINGS_SHEET, full=True)
+    return col_index
+
+def match_legacy_rows(savings_df, bank_df):
+    """
+    Matches savings rows written before txn_id existed to bank rows by (txn_timestamp, amount).
+    Returns a frame of the savings row index and the matched bank txn_id; nothing is written.
+    """
+    legacy = savings_df[savings_df["txn_id"].astype(str).str.strip() == ""]
+    if legacy.empty or bank_df.empty:
+        return pd.DataFrame(columns=["index", "txn_id"])
+    # Identical bank rows (same timestamp and amount) are paired with legacy rows copy by copy,
+    # skipping those already linked, so each one gets its own txn_id
+    key = ["txn_timestamp", "amount"]
+    candidates = bank_df[key + ["txn_id"]].assign(amount=bank_df["amount"].astype("float64"))
+    candidates = candidates[~candidates["txn_id"].isin(set(savings_df["txn_id"].astype(str)))]
+    candidates = candidates.assign(copy=candidates.groupby(key).cumcount())
+    legacy = legacy[key].reset_index()
+    matched = legacy.assign(copy=legacy.groupby(key).cumcount()).merge(
+        candidates, on=key + ["copy"], how="inner"
+    )
+    return matched[["index", "txn_id"]]
+
+def link_legacy_rows(savings_df, bank_df):
+    """
+    Writes the matched bank txn_id back into legacy savings rows (see match_legacy_rows) in one
+    queued write. Only runs when asked to: the header may need a txn_id column first, and that
+    is a direct Sheets write. Returns the number of rows linked.
+    """
+    matched = match_legacy_rows(savings_df, bank_df)
+    if matched.empty:
+        return 0
+    col_index = txn_id_column()
+    cells = [[index + 2, col_index, txn_id] for index, txn_id in zip(matched["index"], matched["txn_id"])]
+    # Positional write: the rows must still be the ones read (raises RowsMovedError otherwise)
+    id_cols = [col for col in ["description", "allocated_to", "amount"] if col in savings_df.columns]
+    expected = {index + 2: savings_df.loc[index, id_cols].to_dict() for index in matched["index"]}
+    queue_update(SAVINGS_SHEET, cells, SHEET_URL, expected)
+    savings_df.loc[matched["index"], "txn_id"] = matched["txn_id"].values
+    return len(matched)
+
 def show():
     # Header with back button
     col1, col2 = st.columns([1, 4])
@@ -38,21 +87,33 @@ def show():
         """, unsafe_allow_html=True)
 
     try:
-        # --- Load and clean bank transactions ---
-        bank_ws = get_worksheet(SHEET_URL, BANK_SHEET)
-        bank_df = pd.DataFrame(bank_ws.get_all_records())
+        with stage("savings: load & link"):
+            # --- Load and clean bank transactions ---
+            ctx = get_context()
+            ctx.prefetch(BANK_SHEET, SAVINGS_SHEET)
+            bank_df = ctx.transactions_between(BANK_SHEET)  # every year: savings link to archived rows too
+            bank_df = bank_df[bank_df["my_category"].str.lower() == "savings"]
 
-        bank_df["txn_timestamp"] = pd.to_datetime(bank_df["txn_timestamp"], utc=True, errors="coerce").dt.tz_localize(None)
-        bank_df["amount"] = pd.to_numeric(bank_df["amount"], errors="coerce")
-        bank_df = bank_df[bank_df["my_category"].str.lower() == "savings"]
+            # --- Load existing savings records (once; reused for the summary) ---
+            savings_df = ctx.frame(SAVINGS_SHEET).copy()  # edited in place when linking legacy rows
 
-        # --- Load existing savings records ---
-        savings_ws = get_worksheet(SHEET_URL, SAVINGS_SHEET)
-        savings_df = pd.DataFrame(savings_ws.get_all_records())
+            if not savings_df.empty:
+                savings_df["txn_timestamp"] = parse_timestamps(savings_df["txn_timestamp"])
+                savings_df["amount"] = pd.to_numeric(savings_df["amount"], errors="coerce")
+                if "txn_id" not in savings_df.columns:
+                    savings_df["txn_id"] = ""
+                legacy_links = match_legacy_rows(savings_df, bank_df)
 
-        if not savings_df.empty:
-            savings_df["txn_timestamp"] = pd.to_datetime(savings_df["txn_timestamp"], utc=True, errors="coerce").dt.tz_localize(None)
-            savings_df["amount"] = pd.to_numeric(savings_df["amount"], errors="coerce")
+        if not savings_df.empty and not legacy_links.empty:
+            st.info(f"🔗 {len(legacy_links)} savings rows were saved before transaction IDs existed; "
+                    "they are matched to their bank transactions by date and amount.")
+            if st.button("🔗 Link Legacy Rows", help="Writes the matching transaction ID into these savings rows"):
+                try:
+                    st.success(f"✅ Linked {link_legacy_rows(savings_df, bank_df)} savings rows.")
+                except RowsMovedError as e:
+                    st.warning(str(e))
+            # Counted as allocated on this page either way
+            savings_df.loc[legacy_links["index"], "txn_id"] = legacy_links["txn_id"].values
 
         # --- KPI Cards ---
         st.markdown("### 📌 Key Metrics")
@@ -75,17 +136,12 @@ def show():
             </div>
             """, unsafe_allow_html=True)
 
-        # --- Filter out already categorized transactions ---
-        uncategorized_df = bank_df.copy()
-        if not savings_df.empty:
-            merged = pd.merge(
-                bank_df,
-                savings_df[["txn_timestamp", "amount"]],
-                on=["txn_timestamp", "amount"],
-                how="left",
-                indicator=True
-            )
-            uncategorized_df = merged[merged["_merge"] == "left_only"].drop(columns=["_merge"])
+        # --- Filter out already categorized transactions (set difference on txn_id) ---
+        with stage("savings: reconcile"):
+            uncategorized_df = bank_df
+            if not savings_df.empty:
+                allocated_ids = set(savings_df["txn_id"].astype(str))
+                uncategorized_df = bank_df[~bank_df["txn_id"].isin(allocated_ids)]
 
         st.markdown("### 📝 Uncategorized Savings Transactions")
         st.markdown("Allocate each transaction to a specific goal below:")
@@ -98,20 +154,21 @@ def show():
                     goal = st.selectbox("Allocate to", GOAL_OPTIONS, key=f"goal_{index}")
                     if st.button("✅ Save Allocation", key=f"save_{index}"):
                         new_entry = {
+                            "txn_id": row["txn_id"],
                             "txn_timestamp": row["txn_timestamp"].strftime("%Y-%m-%dT%H:%M:%S"),
                             "description": row["my_category"],
                             "amount": row["amount"],
                             "allocated_to": goal
                         }
-                        update_worksheet_rows(SHEET_URL, SAVINGS_SHEET, [new_entry])
+                        txn_id_column()
+                        header = get_header(SHEET_URL, SAVINGS_SHEET)
+                        queue_append(SAVINGS_SHEET, [[new_entry.get(col, "") for col in header]], SHEET_URL)
                         st.success("✅ Saved!")
                         st.experimental_rerun()
 
         # --- Summary Table ---
         st.markdown("### 📊 Summary of Categorized Savings")
-        savings_df = pd.DataFrame(savings_ws.get_all_records())
         if not savings_df.empty:
-            savings_df["amount"] = pd.to_numeric(savings_df["amount"], errors="coerce")
             summary = savings_df.groupby("allocated_to")["amount"].sum().reset_index()
             summary.columns = ["Goal", "Total Saved"]
             summary.index += 1  # Start index from 1
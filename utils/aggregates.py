@@ -0,0 +1,107 @@
+import pandas as pd
+from utils.transaction import parse_timestamps
+from utils.partitions import base_of
+
+# === Monthly Aggregate Cube ===
+# One row per source × person × month × my_category × type, holding the summed amount
+# and transaction count. It lives next to the mirror tables and is adjusted by the
+# delta of every sync, so dashboards read months × categories instead of raw history.
+# Year partitions of a worksheet add into the same source.
+CUBE_SOURCES = {"bank_transactions": "bank", "credit_card": "credit"}
+CUBE_KEYS = ["source", "person", "month", "my_category", "type"]
+
+
+def ensure_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS _monthly_cube (
+            source TEXT NOT NULL,
+            person TEXT NOT NULL,
+            month TEXT NOT NULL,
+            my_category TEXT NOT NULL,
+            type TEXT NOT NULL,
+            amount REAL NOT NULL,
+            txn_count INTEGER NOT NULL,
+            PRIMARY KEY (source, person, month, my_category, type)
+        ) WITHOUT ROWID
+    """)
+
+
+def parse_months(timestamps: pd.Series) -> pd.Series:
+    """
+    Returns "YYYY-MM" for every timestamp ("" when unparseable).
+    """
+    return parse_timestamps(timestamps).dt.strftime("%Y-%m").fillna("")
+
+
+def _contributions(source, header, rows, sign):
+    df = pd.DataFrame(rows, columns=header)
+    if df.empty:
+        return pd.DataFrame(columns=CUBE_KEYS + ["amount", "txn_count"])
+
+    def text(col):
+        return df[col].fillna("").astype(str).str.strip() if col in df.columns else pd.Series("", index=df.index)
+
+    amount = pd.to_numeric(df["amount"], errors="coerce").fillna(0) if "amount" in df.columns else 0.0
+    return pd.DataFrame({
+        "source": source,
+        "person": text("person"),
+        "month": parse_months(text("txn_timestamp")),
+        "my_category": text("my_category").str.lower(),
+        "type": text("type").str.upper(),
+        "amount": amount * sign,
+        "txn_count": sign,
+    })
+
+
+def _merge(conn, delta):
+    if delta.empty:
+        return
+    grouped = delta.groupby(CUBE_KEYS, as_index=False)[["amount", "txn_count"]].sum()
+    conn.executemany(
+        "INSERT INTO _monthly_cube (source, person, month, my_category, type, amount, txn_count) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (source, person, month, my_category, type) DO UPDATE SET "
+        "amount = amount + excluded.amount, txn_count = txn_count + excluded.txn_count",
+        [(*keys, float(amount), int(count)) for *keys, amount, count in grouped.itertuples(index=False)]
+    )
+    conn.execute("DELETE FROM _monthly_cube WHERE txn_count <= 0")
+
+
+def is_source(worksheet_name):
+    return base_of(worksheet_name) in CUBE_SOURCES
+
+
+def apply_delta(conn, worksheet_name, header, removed_rows, added_rows, removed_header=None):
+    """
+    Subtracts the old version of changed/deleted rows and adds their new version.
+    removed_header is the header of removed_rows when it differs (the worksheet's header changed).
+    """
+    source = CUBE_SOURCES[base_of(worksheet_name)]
+    _merge(conn, pd.concat([
+        _contributions(source, removed_header or header, removed_rows, -1),
+        _contributions(source, header, added_rows, 1),
+    ], ignore_index=True))
+
+
+def rebuild(conn, worksheet_name, partitions):
+    """
+    Recomputes every cell of one source from the full rows of all its partitions,
+    given as [(header, rows), ...].
+    """
+    source = CUBE_SOURCES[base_of(worksheet_name)]
+    conn.execute("DELETE FROM _monthly_cube WHERE source = ?", (source,))
+    _merge(conn, pd.concat([_contributions(source, header, rows, 1) for header, rows in partitions],
+                           ignore_index=True))
+
+
+def has_source(conn, worksheet_name):
+    found = conn.execute(
+        "SELECT 1 FROM _monthly_cube WHERE source = ? LIMIT 1", (CUBE_SOURCES[base_of(worksheet_name)],)
+    ).fetchone()
+    return found is not None
+
+
+def read_cube(conn):
+    return pd.read_sql_query(
+        "SELECT source, person, month, my_category, type, amount, txn_count FROM _monthly_cube", conn
+    )
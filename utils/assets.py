@@ -0,0 +1,18 @@
+import os
+import streamlit as st
+
+CSS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets", "style.css")
+
+
+@st.cache_resource
+def _stylesheet():
+    with open(CSS_PATH) as f:
+        return f"<style>{f.read()}</style>"
+
+
+def inject_css():
+    """
+    Adds the app stylesheet to the page. home.py calls this once per rerun;
+    the file itself is read once per process.
+    """
+    st.markdown(_stylesheet(), unsafe_allow_html=True)
@@ -0,0 +1,197 @@
+import pandas as pd
+from utils.transaction import parse_timestamps
+from utils.partitions import base_of
+
+# === Balance Index ===
+# Every bank row with a parseable timestamp, ordered per account by (txn_timestamp, worksheet, row),
+# with its running balance: the reported current_balance when the row has one, else the
+# previous balance plus/minus the amount. _balance_daily keeps each account's closing
+# balance per day. Syncs only recompute an account from the first day they touched,
+# so appending new transactions touches just the new rows. Year partitions of the bank
+# worksheet (bank_transactions_2023, ...) are indexed alongside it.
+WORKSHEET = "bank_transactions"
+
+
+def is_source(worksheet_name):
+    return base_of(worksheet_name) == WORKSHEET
+
+
+def ensure_schema(conn):
+    columns = [info[1] for info in conn.execute("PRAGMA table_info(_balance_index)")]
+    if columns and "worksheet" not in columns:
+        # Derived data: indexes from before partitions are dropped and rebuilt on the next load
+        conn.execute("DROP TABLE _balance_index")
+        conn.execute("DROP TABLE IF EXISTS _balance_daily")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS _balance_index (
+            worksheet TEXT NOT NULL,
+            row INTEGER NOT NULL,
+            account_number TEXT NOT NULL,
+            ts TEXT NOT NULL,
+            amount REAL NOT NULL,
+            type TEXT NOT NULL,
+            reported REAL,
+            balance REAL,
+            PRIMARY KEY (worksheet, row)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS _balance_order ON _balance_index (account_number, ts, worksheet, row)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS _balance_daily (
+            account_number TEXT NOT NULL,
+            day TEXT NOT NULL,
+            balance REAL NOT NULL,
+            PRIMARY KEY (account_number, day)
+        ) WITHOUT ROWID
+    """)
+
+
+def _entries(worksheet_name, header, numbered_rows):
+    """
+    (worksheet, row, account_number, ts, amount, type, reported) for rows with a parseable timestamp.
+    """
+    if not numbered_rows:
+        return []
+    row_numbers = [row_number for row_number, _ in numbered_rows]
+    df = pd.DataFrame([values for _, values in numbered_rows], columns=header)
+
+    def column(col):
+        return df[col] if col in df.columns else pd.Series("", index=df.index)
+
+    ts = parse_timestamps(column("txn_timestamp").astype(str)).dt.strftime("%Y-%m-%dT%H:%M:%S")
+    amount = pd.to_numeric(column("amount"), errors="coerce").fillna(0)
+    reported = pd.to_numeric(column("current_balance"), errors="coerce")
+    frame = pd.DataFrame({
+        "worksheet": worksheet_name,
+        "row": row_numbers,
+        "account_number": column("account_number").astype(str).str.strip(),
+        "ts": ts,
+        "amount": amount.astype(float),
+        "type": column("type").astype(str).str.strip().str.upper(),
+        "reported": reported.astype(object).where(reported.notna(), None),
+    })
+    frame = frame[frame["ts"].notna()]
+    return list(frame.itertuples(index=False, name=None))
+
+
+def _recompute(conn, account, day):
+    """
+    Rewrites the running balance of one account from the start of day on, and its daily closes.
+    """
+    previous = conn.execute(
+        "SELECT balance FROM _balance_index WHERE account_number = ? AND ts < ? "
+        "ORDER BY ts DESC, worksheet DESC, row DESC LIMIT 1",
+        (account, day)
+    ).fetchone()
+    balance = previous[0] if previous and previous[0] is not None else 0.0
+
+    suffix = conn.execute(
+        "SELECT worksheet, row, ts, amount, type, reported FROM _balance_index "
+        "WHERE account_number = ? AND ts >= ? ORDER BY ts, worksheet, row",
+        (account, day)
+    ).fetchall()
+    updates, closes = [], {}
+    for worksheet_name, row, ts, amount, txn_type, reported in suffix:
+        if reported is not None:
+            balance = reported
+        else:
+            balance += amount if txn_type == "CREDIT" else -amount
+        updates.append((balance, worksheet_name, row))
+        closes[ts[:10]] = balance  # rows are in time order, so the last one per day wins
+    conn.executemany("UPDATE _balance_index SET balance = ? WHERE worksheet = ? AND row = ?", updates)
+
+    conn.execute("DELETE FROM _balance_daily WHERE account_number = ? AND day >= ?", (account, day))
+    conn.executemany(
+        "INSERT INTO _balance_daily (account_number, day, balance) VALUES (?, ?, ?)",
+        [(account, close_day, close) for close_day, close in closes.items()]
+    )
+
+
+def _touch(starts, account, ts):
+    starts[account] = min(starts.get(account, ts[:10]), ts[:10])
+
+
+def _insert_and_recompute(conn, entries, starts):
+    conn.executemany(
+        "INSERT OR REPLACE INTO _balance_index (worksheet, row, account_number, ts, amount, type, reported) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        entries
+    )
+    for _, _, account, ts, *_ in entries:
+        _touch(starts, account, ts)
+    for account, day in starts.items():
+        _recompute(conn, account, day)
+
+
+def apply_delta(conn, worksheet_name, header, changed_rows, last_row):
+    """
+    changed_rows are (row_number, values) written by a sync; rows after last_row were deleted.
+    Only accounts touched by the change are recomputed, from the first day touched.
+    """
+    row_numbers = [row_number for row_number, _ in changed_rows]
+    starts = {}
+    removed = conn.execute(
+        "SELECT row, account_number, ts FROM _balance_index WHERE worksheet = ? AND row > ?",
+        (worksheet_name, last_row)
+    ).fetchall()
+    for start in range(0, len(row_numbers), 500):
+        batch = row_numbers[start:start + 500]
+        removed += conn.execute(
+            f"SELECT row, account_number, ts FROM _balance_index "
+            f"WHERE worksheet = ? AND row IN ({', '.join(['?'] * len(batch))})",
+            [worksheet_name] + batch
+        ).fetchall()
+    for _, account, ts in removed:
+        _touch(starts, account, ts)
+    conn.execute("DELETE FROM _balance_index WHERE worksheet = ? AND row > ?", (worksheet_name, last_row))
+    conn.executemany("DELETE FROM _balance_index WHERE worksheet = ? AND row = ?",
+                     [(worksheet_name, row) for row, _, _ in removed])
+    _insert_and_recompute(conn, _entries(worksheet_name, header, changed_rows), starts)
+
+
+def rebuild(conn, worksheet_name, header, numbered_rows):
+    """
+    Replaces every entry of one worksheet (other partitions keep theirs).
+    """
+    starts = {}
+    for account, ts in conn.execute(
+        "SELECT account_number, MIN(ts) FROM _balance_index WHERE worksheet = ? GROUP BY account_number",
+        (worksheet_name,)
+    ):
+        _touch(starts, account, ts)
+    conn.execute("DELETE FROM _balance_index WHERE worksheet = ?", (worksheet_name,))
+    _insert_and_recompute(conn, _entries(worksheet_name, header, numbered_rows), starts)
+
+
+def is_empty(conn):
+    return conn.execute("SELECT 1 FROM _balance_index LIMIT 1").fetchone() is None
+
+
+def latest_balances(conn):
+    """
+    Latest balance per account with the day it was reached, newest first.
+    """
+    return pd.read_sql_query("""
+        SELECT d.account_number, d.day, d.balance FROM _balance_daily d
+        JOIN (SELECT account_number, MAX(day) AS day FROM _balance_daily GROUP BY account_number) last
+          ON d.account_number = last.account_number AND d.day = last.day
+        ORDER BY d.day DESC
+    """, conn)
+
+
+def net_worth(conn, freq="D"):
+    """
+    Net worth over time: every account's closing balance carried forward and summed,
+    per day ("D") or as of each month end ("M"). Returns columns date, net_worth.
+    """
+    daily = pd.read_sql_query("SELECT account_number, day, balance FROM _balance_daily", conn)
+    if daily.empty:
+        return pd.DataFrame(columns=["date", "net_worth"])
+    wide = daily.pivot(index="day", columns="account_number", values="balance")
+    wide.index = pd.to_datetime(wide.index)
+    wide = wide.asfreq("D").ffill()
+    if freq == "M":
+        wide = wide.groupby(wide.index.to_period("M")).last()
+        wide.index = wide.index.to_timestamp(how="end").normalize()
+    series = wide.sum(axis=1, min_count=1)
+    return pd.DataFrame({"date": series.index, "net_worth": series.values})
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# === Budget vs Actual Engine ===
+# One pass joins every budget row with the debits of the monthly aggregate cube (bank and
+# credit card) on month × person × category. The result is numeric and memoized per data
+# version; pages slice it by person/month and format numbers only when displaying them.
+KEYS = ["month", "person", "category"]
+SOURCES = {"bank": "bank_spent", "credit": "credit_spent"}
+TABLE_COLS = KEYS + ["budgeted", "bank_spent", "credit_spent", "spent"]
+
+
+def normalize_budget(budget_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Budget rows keyed like the cube: month "YYYY-MM", person, lowercased category.
+    """
+    return pd.DataFrame({
+        "month": pd.to_datetime(budget_df["month_year"], errors="coerce").dt.strftime("%Y-%m").fillna(""),
+        "person": budget_df["person"].astype(str).str.strip(),
+        "category": budget_df["category"].astype(str).str.strip().str.lower(),
+        "budgeted": pd.to_numeric(budget_df["budgeted"], errors="coerce").fillna(0),
+    })
+
+
+def actuals(cube: pd.DataFrame) -> pd.DataFrame:
+    """
+    Categorized debits per month × person × category, one column per source.
+    """
+    debits = cube[(cube["type"] == "DEBIT") & (cube["my_category"] != "") & cube["source"].isin(SOURCES)]
+    spent = debits.pivot_table(index=["month", "person", "my_category"], columns="source",
+                               values="amount", aggfunc="sum", fill_value=0)
+    spent = spent.reindex(columns=list(SOURCES), fill_value=0).rename(columns=SOURCES)
+    spent.index.names = KEYS
+    return spent.reset_index()
+
+
+def budget_vs_actual(budget_df: pd.DataFrame, cube: pd.DataFrame) -> pd.DataFrame:
+    """
+    Budgeted and spent amounts for every month, person and category that has either.
+    """
+    budget = normalize_budget(budget_df).groupby(KEYS, as_index=False)["budgeted"].sum()
+    table = budget.merge(actuals(cube), on=KEYS, how="outer")
+    table[["budgeted", "bank_spent", "credit_spent"]] = table[["budgeted", "bank_spent", "credit_spent"]].fillna(0)
+    table["spent"] = table["bank_spent"] + table["credit_spent"]
+    return table[TABLE_COLS]
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def compute(version, _budget_df, _cube):
+    """
+    budget_vs_actual() memoized on the data version of budget, bank_transactions and credit_card.
+    Returns (table, budget_months) with budget months newest first.
+    """
+    table = budget_vs_actual(_budget_df, _cube)
+    budget_months = sorted(set(normalize_budget(_budget_df)["month"]) - {""}, reverse=True)
+    return table, budget_months
+
+
+def usage_pct(spent, budgeted):
+    spent, budgeted = np.asarray(spent, dtype=float), np.asarray(budgeted, dtype=float)
+    return np.round(np.divide(spent * 100, budgeted, out=np.zeros_like(spent), where=budgeted > 0), 2)
+
+
+def select(table: pd.DataFrame, month, person="All") -> pd.DataFrame:
+    """
+    Per-category rows for one month and person ("All" sums both people), numeric throughout.
+    """
+    rows = table[table["month"] == month]
+    if person != "All":
+        rows = rows[rows["person"] == person]
+    selection = rows.groupby("category", as_index=False)[["budgeted", "bank_spent", "credit_spent", "spent"]].sum()
+    selection["used_pct"] = usage_pct(selection["spent"], selection["budgeted"])
+    return selection
+
+
+def totals(selection: pd.DataFrame):
+    """
+    Returns (total_budgeted, total_spent, overall_usage_pct) for a selection.
+    """
+    budgeted, spent = selection["budgeted"].sum(), selection["spent"].sum()
+    return budgeted, spent, float(usage_pct([spent], [budgeted])[0])
@@ -0,0 +1,108 @@
+import pandas as pd
+import streamlit as st
+import plotly.express as px
+import plotly.io as pio
+
+# === Dashboard Figures ===
+# Figures are built once per (person, month, data version) and cached as serialized
+# Plotly JSON, so flipping the dashboard filters back and forth skips plotly.express.
+# Arguments starting with "_" are not part of the cache key: they are derived from the
+# keyed ones and only read on a cache miss.
+TREND_MONTHS = 12
+CACHE_ENTRIES = 64
+
+
+def to_figure(spec):
+    return pio.from_json(spec, skip_invalid=True)
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def category_specs(person, month, version, _actuals_per_cat):
+    """
+    Returns {"pie": json, "bar": json} for the category breakdown of one person/month.
+    """
+    fig_pie = px.pie(
+        _actuals_per_cat,
+        names="Category",
+        values="Spent",
+        title="🧁 Category-wise Spending Breakdown",
+        color_discrete_sequence=px.colors.qualitative.Set3
+    )
+    fig_pie.update_traces(textposition='inside', textinfo='percent+label')
+    fig_pie.update_layout(
+        title_x=0.5,
+        title_font_size=16,
+        showlegend=True,
+        height=400
+    )
+
+    top_categories = _actuals_per_cat.nlargest(8, 'Spent')
+    fig_bar = px.bar(
+        top_categories,
+        x='Spent',
+        y='Category',
+        orientation='h',
+        title="📊 Top Spending Categories",
+        color='Spent',
+        color_continuous_scale='viridis'
+    )
+    fig_bar.update_layout(
+        title_x=0.5,
+        title_font_size=16,
+        height=400,
+        xaxis_title="Amount (₹)",
+        yaxis_title="Category"
+    )
+    return {"pie": fig_pie.to_json(), "bar": fig_bar.to_json()}
+
+
+def monthly_trend(debits, month, months=TREND_MONTHS):
+    """
+    Monthly totals from cube rows for the `months` months ending at `month` (YYYY-MM),
+    with months that had no spending filled in as zero.
+    """
+    end = pd.Period(month, freq="M")
+    window = pd.period_range(end - (months - 1), end, freq="M").strftime("%Y-%m")
+    totals = debits[debits["month"].isin(window)].groupby("month")["amount"].sum()
+    trend = totals.reindex(window, fill_value=0).reset_index()
+    trend.columns = ["month_year", "amount"]
+    return trend
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def trend_spec(person, month, version, _debits):
+    fig_line = px.line(
+        monthly_trend(_debits, month),
+        x="month_year",
+        y="amount",
+        title="📈 Monthly Spending Trend",
+        markers=True
+    )
+    fig_line.update_layout(
+        title_x=0.5,
+        title_font_size=16,
+        height=400,
+        xaxis_title="Month",
+        yaxis_title="Total Amount (₹)"
+    )
+    fig_line.update_traces(line_color='#667eea', marker_color='#667eea')
+    return fig_line.to_json()
+
+
+@st.cache_data(max_entries=CACHE_ENTRIES, show_spinner=False)
+def net_worth_spec(version, _series):
+    fig_area = px.area(
+        _series,
+        x="date",
+        y="net_worth",
+        title="🏦 Net Worth Over Time"
+    )
+    fig_area.update_layout(
+        title_x=0.5,
+        title_font_size=16,
+        height=400,
+        xaxis_title="Month",
+        yaxis_title="Net Worth (₹)"
+    )
+    fig_area.update_traces(line_color='#667eea')
+    return fig_area.to_json()
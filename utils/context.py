@@ -0,0 +1,151 @@
+import pandas as pd
+import streamlit as st
+from utils import store
+from utils.aggregates import CUBE_SOURCES
+from utils.balances import WORKSHEET as BALANCE_SHEET
+from utils.partitions import base_of
+from utils.transaction import to_transactions
+from utils.timing import stage
+
+SESSION_KEY = "data_context"
+
+
+class DataContext:
+    """
+    Loads each worksheet from the local mirror at most once per rerun and memoizes its
+    typed form, so every section of a page shares the same frames. A frame is reloaded
+    only if its mirror went stale or changed mid-run (e.g. after a write). Frames are handed out as
+    shallow copies: sections may add or replace columns without affecting each other.
+    """
+
+    def __init__(self):
+        self._raw = {}
+        self._loaded_versions = {}
+        self._typed = {}
+        self._cube = None
+        self._balances = {}
+        self._errors = {}
+        self.counters = {"fetches": 0, "loads": 0, "parses": 0}
+
+    def _refresh(self, worksheet_name):
+        if worksheet_name in self._errors:
+            raise self._errors[worksheet_name]
+        stale, version = store.mirror_state(worksheet_name)
+        if stale or worksheet_name not in self._raw or self._loaded_versions.get(worksheet_name) != version:
+            if stale:
+                self.counters["fetches"] += 1  # load_frame will pull it from Google Sheets
+            self._raw[worksheet_name] = store.load_frame(worksheet_name)
+            self._loaded_versions[worksheet_name] = store.mirror_state(worksheet_name)[1]
+            self.counters["loads"] += 1
+            self._typed.pop(worksheet_name, None)
+            if base_of(worksheet_name) in CUBE_SOURCES:
+                self._cube = None
+            if base_of(worksheet_name) == BALANCE_SHEET:
+                self._balances.clear()
+
+    def prefetch(self, *worksheet_names):
+        """
+        Fetches every stale mirror a page needs in parallel before its sections load them.
+        A sheet that fails keeps its error, which its loader raises as before.
+        """
+        stale = [name for name in worksheet_names if name not in self._raw and store.needs_sync(name)]
+        if not stale:
+            return
+        with stage(f"sheets: fetch {len(stale)} in parallel"):
+            _, errors = store.sync_many(stale)
+        self.counters["fetches"] += len(stale)
+        self._errors.update(errors)
+
+    def frame(self, worksheet_name):
+        """
+        Raw worksheet frame, exactly as get_all_records() would build it.
+        """
+        self._refresh(worksheet_name)
+        return self._raw[worksheet_name].copy(deep=False)
+
+    def transactions(self, worksheet_name):
+        """
+        bank_transactions / credit_card with the shared schema and txn_id applied.
+        """
+        self._refresh(worksheet_name)
+        if worksheet_name not in self._typed:
+            with stage(f"parse {worksheet_name}"):
+                self._typed[worksheet_name] = to_transactions(self._raw[worksheet_name], worksheet_name)
+            self.counters["parses"] += 1
+        return self._typed[worksheet_name].copy(deep=False)
+
+    def transactions_between(self, base, start=None, end=None):
+        """
+        Typed rows of bank_transactions / credit_card with start <= txn_timestamp < end
+        (either may be None), across its archived years. Only the year partitions that
+        overlap the range are synced and parsed. Frames of several partitions are concatenated
+        with a fresh index.
+        """
+        names = store.partition_names(base, start, end)
+        self.prefetch(*names)
+        frames = [self.transactions(name) for name in names]
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        if "txn_timestamp" not in df.columns:
+            return df
+        if start is not None:
+            df = df[df["txn_timestamp"] >= pd.Timestamp(start)]
+        if end is not None:
+            df = df[df["txn_timestamp"] < pd.Timestamp(end)]
+        return df
+
+    def cube(self):
+        """
+        Monthly aggregate cube, read once per rerun.
+        """
+        for worksheet_name in CUBE_SOURCES:
+            self._refresh(worksheet_name)
+        if self._cube is None:
+            self._cube = store.load_cube()
+            self.counters["loads"] += 1
+        return self._cube.copy(deep=False)
+
+    def latest_balances(self):
+        """
+        Latest balance per bank account from the balance index, newest first.
+        """
+        self._refresh(BALANCE_SHEET)
+        if "latest" not in self._balances:
+            self._balances["latest"] = store.load_latest_balances()
+            self.counters["loads"] += 1
+        return self._balances["latest"].copy(deep=False)
+
+    def net_worth(self, freq="M"):
+        """
+        Net worth series (date, net_worth) per day ("D") or month end ("M").
+        """
+        self._refresh(BALANCE_SHEET)
+        if freq not in self._balances:
+            self._balances[freq] = store.load_net_worth(freq)
+            self.counters["loads"] += 1
+        return self._balances[freq].copy(deep=False)
+
+    def version(self, *worksheet_names):
+        """
+        Data version of the given worksheets as loaded in this run, for keying caches.
+        """
+        for worksheet_name in worksheet_names:
+            self._refresh(worksheet_name)
+        return store.data_version(worksheet_names)
+
+    def summary(self):
+        c = self.counters
+        return f"🔎 This run: {c['fetches']} sheet fetches · {c['loads']} local loads · {c['parses']} parses"
+
+
+def new_context():
+    """
+    Starts a fresh context for this rerun. Called once at the top of home.py.
+    """
+    ctx = DataContext()
+    st.session_state[SESSION_KEY] = ctx
+    return ctx
+
+
+def get_context():
+    ctx = st.session_state.get(SESSION_KEY)
+    return ctx if ctx is not None else new_context()
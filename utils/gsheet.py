@@ -1,37 +1,322 @@
 import os
 import json
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future
 import gspread
 from google.oauth2 import service_account
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+from utils.timing import stage, record_api_call
 
-# --- Load credentials from environment variable ---
-gcred_str = os.getenv("GCRED_JSON")
-if not gcred_str:
-    raise EnvironmentError("❌ 'GCRED_JSON' environment variable not found.")
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+POOL_SIZE = 10
 
-# --- Convert to dict & clean private key ---
-creds_dict = json.loads(gcred_str)
-creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
+# "google" talks to the Sheets API; "local" uses the offline stand-in in utils/local_sheets.py
+BACKEND = os.getenv("COFI_SHEETS_BACKEND", "google").strip().lower()
+BACKENDS = ("google", "local")
 
-SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+# --- Quota (Sheets allows 60 read and 60 write requests per minute per user) ---
+QUOTA_PER_MINUTE = {
+    "read": int(os.getenv("COFI_SHEETS_READS_PER_MINUTE", "60")),
+    "write": int(os.getenv("COFI_SHEETS_WRITES_PER_MINUTE", "60")),
+}
+MAX_RETRIES = int(os.getenv("COFI_SHEETS_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("COFI_SHEETS_BACKOFF_BASE", "1"))  # seconds
+BACKOFF_MAX = float(os.getenv("COFI_SHEETS_BACKOFF_MAX", "32"))
+RETRY_STATUS = {"read": {429, 500, 502, 503}, "write": {429}}  # a failed write may have landed unless it was throttled
+
+READ_METHODS = {"get_all_values", "get_all_records", "row_values", "col_values", "get", "get_values", "batch_get"}
+WRITE_METHODS = {"append_row", "append_rows", "update", "update_cell", "batch_update", "add_cols", "add_rows", "delete_rows"}
+
+# --- Lazily created client & handle caches ---
+_lock = threading.RLock()
+_client = None
+_spreadsheets = {}  # sheet_url -> Spreadsheet
+_worksheets = {}    # (sheet_url, worksheet_name) -> Worksheet
+_headers = {}       # (sheet_url, worksheet_name) -> header row
+_titles = {}        # sheet_url -> worksheet titles, in tab order
+
+# --- Scheduler state ---
+_quota_lock = threading.Lock()
+_sent = {"read": deque(), "write": deque()}  # send times within the last minute
+_inflight_lock = threading.Lock()
+_inflight = {}  # coalescing key -> Future of the read in progress
+scheduler_stats = {"requests": 0, "retries": 0, "coalesced": 0, "waited_seconds": 0.0}
+
+
+class QuotaExceededError(RuntimeError):
+    pass
+
+
+def _load_credentials():
+    # --- Load credentials from environment variable ---
+    gcred_str = os.getenv("GCRED_JSON")
+    if not gcred_str:
+        raise EnvironmentError("❌ 'GCRED_JSON' environment variable not found.")
+
+    # --- Convert to dict & clean private key ---
+    creds_dict = json.loads(gcred_str)
+    creds_dict["private_key"] = creds_dict["private_key"].replace("\\n", "\n")
+    return service_account.Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+
+
+# === Request Scheduler ===
+def _acquire(kind):
+    """
+    Blocks until sending one more request of this kind stays within the per-minute quota.
+    """
+    while True:
+        with _quota_lock:
+            now = time.monotonic()
+            sent = _sent[kind]
+            while sent and now - sent[0] >= 60:
+                sent.popleft()
+            if len(sent) < QUOTA_PER_MINUTE[kind]:
+                sent.append(now)
+                return
+            wait = 60 - (now - sent[0])
+        scheduler_stats["waited_seconds"] += wait
+        time.sleep(wait)
+
+
+def _status(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _send(kind, fn, *args, **kwargs):
+    for attempt in range(MAX_RETRIES + 1):
+        _acquire(kind)
+        scheduler_stats["requests"] += 1
+        try:
+            return fn(*args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            status = _status(e)
+            if status not in RETRY_STATUS[kind]:
+                raise
+            if attempt == MAX_RETRIES:
+                if status == 429:
+                    raise QuotaExceededError(
+                        f"⏳ Google Sheets quota exceeded after {MAX_RETRIES} retries. Please try again in a minute."
+                    ) from e
+                raise
+            # Exponential backoff with full jitter
+            delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+            scheduler_stats["retries"] += 1
+            scheduler_stats["waited_seconds"] += delay
+            time.sleep(delay)
+
+
+def schedule(kind, fn, *args, coalesce_key=None, **kwargs):
+    """
+    Runs one Sheets API call ("read" or "write") within the quota, retrying throttled
+    and transient failures with exponential backoff. Reads with the same coalesce_key
+    that overlap in time share one request (and the same result object).
+    """
+    if kind == "write" or coalesce_key is None:
+        return _send(kind, fn, *args, **kwargs)
+
+    with _inflight_lock:
+        future = _inflight.get(coalesce_key)
+        owner = future is None
+        if owner:
+            future = _inflight[coalesce_key] = Future()
+    if not owner:
+        scheduler_stats["coalesced"] += 1
+        return future.result()
+
+    try:
+        result = _send(kind, fn, *args, **kwargs)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(coalesce_key, None)
+
+
+class ScheduledWorksheet:
+    """
+    Worksheet wrapper that sends every API method through schedule(); other attributes pass through.
+    """
+
+    def __init__(self, worksheet, sheet_url):
+        self._worksheet = worksheet
+        self._sheet_url = sheet_url
+
+    def __getattr__(self, name):
+        attr = getattr(self._worksheet, name)
+        if name in READ_METHODS:
+            def read(*args, **kwargs):
+                key = (self._sheet_url, self._worksheet.title, name, repr(args), repr(sorted(kwargs.items())))
+                return schedule("read", attr, *args, coalesce_key=key, **kwargs)
+            return read
+        if name in WRITE_METHODS:
+            return lambda *args, **kwargs: schedule("write", attr, *args, **kwargs)
+        return attr
+
+
+def _count_request(response, *args, **kwargs):
+    record_api_call("read" if response.request.method == "GET" else "write")
+
+
+def get_client():
+    """
+    Returns the shared gspread client, authorizing on first use.
+    Requests go through one pooled AuthorizedSession, which refreshes the
+    access token before it expires and retries once on a 401.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            credentials = _load_credentials()
+            session = AuthorizedSession(credentials)
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.hooks["response"].append(_count_request)
+            _client = gspread.Client(auth=credentials, session=session)
+        return _client
+
+
+def reset_client():
+    """
+    Drops the client and every cached handle/header, e.g. after the sheet
+    structure changed or credentials were rotated.
+    """
+    global _client
+    with _lock:
+        _client = None
+        _spreadsheets.clear()
+        _worksheets.clear()
+        _headers.clear()
+        _titles.clear()
+
+
+def get_spreadsheet(sheet_url):
+    with _lock:
+        sh = _spreadsheets.get(sheet_url)
+        if sh is None:
+            if BACKEND not in BACKENDS:
+                raise EnvironmentError(f"❌ Unknown COFI_SHEETS_BACKEND '{BACKEND}' (expected one of {', '.join(BACKENDS)}).")
+            if BACKEND == "local":
+                from utils.local_sheets import open_spreadsheet
+                sh = open_spreadsheet(sheet_url)  # local, no request
+            else:
+                sh = schedule("read", get_client().open_by_url, sheet_url)
+            _spreadsheets[sheet_url] = sh
+        return sh
+
+
+def _load_tabs(sheet_url):
+    # One metadata request resolves every tab, so later lookups are free
+    with stage("sheets: open worksheets"):
+        tabs = schedule("read", get_spreadsheet(sheet_url).worksheets)
+    for tab in tabs:
+        _worksheets[(sheet_url, tab.title)] = ScheduledWorksheet(tab, sheet_url)
+    _titles[sheet_url] = [tab.title for tab in tabs]
 
-# --- Create credentials ---
-credentials = service_account.Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-gc = gspread.authorize(credentials)
 
 # --- Exported method ---
 def get_worksheet(sheet_url, worksheet_name):
-    sh = gc.open_by_url(sheet_url)
-    return sh.worksheet(worksheet_name)
+    with _lock:
+        ws = _worksheets.get((sheet_url, worksheet_name))
+        if ws is None:
+            _load_tabs(sheet_url)
+            ws = _worksheets.get((sheet_url, worksheet_name))
+            if ws is None:
+                raise gspread.WorksheetNotFound(worksheet_name)
+        return ws
+
+
+def worksheet_titles(sheet_url, refresh=False):
+    """
+    Returns the titles of every worksheet, listing the tabs only once per process (or on refresh).
+    """
+    with _lock:
+        if refresh or sheet_url not in _titles:
+            _load_tabs(sheet_url)
+        return list(_titles[sheet_url])
+
+
+def add_worksheet(sheet_url, title, rows, cols):
+    """
+    Creates a worksheet and registers it with the handle cache. Returns the scheduled worksheet.
+    """
+    with _lock:
+        tab = schedule("write", get_spreadsheet(sheet_url).add_worksheet, title=title, rows=rows, cols=cols)
+        ws = _worksheets[(sheet_url, title)] = ScheduledWorksheet(tab, sheet_url)
+        if sheet_url in _titles:
+            _titles[sheet_url].append(title)
+        return ws
+
+
+def get_header(sheet_url, worksheet_name):
+    """
+    Returns the worksheet's header row, fetching it only once per process.
+    """
+    with _lock:
+        header = _headers.get((sheet_url, worksheet_name))
+        if header is None:
+            header = get_worksheet(sheet_url, worksheet_name).row_values(1)
+            _headers[(sheet_url, worksheet_name)] = header
+        return header
+
+
+def ensure_column(sheet_url, worksheet_name, column):
+    """
+    Adds column to the end of the header row if it is missing. Returns its 1-based index.
+    """
+    with _lock:
+        header = get_header(sheet_url, worksheet_name)
+        if column in header:
+            return header.index(column) + 1
+        ws = get_worksheet(sheet_url, worksheet_name)
+        col_index = len(header) + 1
+        if ws.col_count < col_index:
+            ws.add_cols(col_index - ws.col_count)
+        ws.update_cell(1, col_index, column)
+        _headers[(sheet_url, worksheet_name)] = header + [column]
+        return col_index
+
+
+def cache_header(sheet_url, worksheet_name, header):
+    """
+    Records a header that was already fetched elsewhere (e.g. during a sync).
+    """
+    with _lock:
+        _headers[(sheet_url, worksheet_name)] = list(header)
+
+
+def contiguous_runs(row_numbers):
+    """
+    Groups sorted row numbers into (start, end) runs of consecutive rows.
+    """
+    runs = []
+    for row_number in sorted(row_numbers):
+        if runs and row_number == runs[-1][1] + 1:
+            runs[-1][1] = row_number
+        else:
+            runs.append([row_number, row_number])
+    return [tuple(run) for run in runs]
+
 
-def update_worksheet_rows(sheet_url, worksheet_name, rows):
+def delete_rows(sheet_url, worksheet_name, row_numbers):
     """
-    Appends a list of dicts (rows) to the worksheet. Each dict should have keys matching the worksheet's columns.
+    Deletes the given rows with a single batchUpdate (one deleteDimension per run of
+    consecutive rows, bottom up so earlier deletions never shift later ones).
+    Returns the number of API requests issued.
     """
-    ws = get_worksheet(sheet_url, worksheet_name)
-    # Get header from the first row
-    header = ws.row_values(1)
-    to_append = []
-    for row in rows:
-        # Ensure the order matches the header
-        to_append.append([row.get(col, "") for col in header])
-    ws.append_rows(to_append, value_input_option="USER_ENTERED")
+    if not row_numbers:
+        return 0
+    sheet_id = get_worksheet(sheet_url, worksheet_name).id
+    requests = [
+        {"deleteDimension": {"range": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": start - 1, "endIndex": end}}}
+        for start, end in reversed(contiguous_runs(row_numbers))
+    ]
+    schedule("write", get_spreadsheet(sheet_url).batch_update, {"requests": requests})
+    return 1
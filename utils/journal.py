@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import streamlit as st
+from gspread.utils import rowcol_to_a1
+from utils.gsheet import contiguous_runs
+
+# === Write-Behind Journal ===
+# Sheet mutations are committed to the _journal table of the local store and acknowledged
+# at once; the writer thread in utils/store.py sends them to Google Sheets in batches.
+# Entries of one worksheet go out strictly in order, and until an entry is flushed it is
+# replayed over whatever the sheet returns, so syncs and page loads already include it.
+#   append: payload is a list of rows (lists of cell strings)
+#   update: payload is a list of [row, col, value] cells (1-based, like the Sheets API)
+OPS = ("append", "update")
+MAX_ATTEMPTS = int(os.getenv("COFI_JOURNAL_MAX_ATTEMPTS", "8"))
+RETRY_BASE = 2     # seconds before the first retry, doubled per attempt
+RETRY_MAX = 300
+BATCH_ROWS = 5000  # rows (or cells) merged into one request
+KEEP_FLUSHED = 24 * 3600  # seconds flushed entries stay counted in the status
+
+
+def ensure_schema(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS _journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sheet_url TEXT NOT NULL,
+            worksheet TEXT NOT NULL,
+            op TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            flushed_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS _journal_queue ON _journal (status, worksheet, id)")
+
+
+def cell(value):
+    """
+    A cell as Sheets reads it back after a USER_ENTERED write, so the mirror row written
+    now hashes the same as its next sync: whole numbers lose a trailing ".0" (450.0 -> "450").
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = value if isinstance(value, str) else str(value)
+    if text.endswith(".0") and text[:-2].lstrip("-").isdigit():
+        text = text[:-2]
+    return text
+
+
+def record(conn, sheet_url, worksheet_name, op, payload):
+    if op not in OPS:
+        raise ValueError(f"Unknown journal op '{op}' (expected one of {', '.join(OPS)}).")
+    return conn.execute(
+        "INSERT INTO _journal (sheet_url, worksheet, op, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+        (sheet_url, worksheet_name, op, json.dumps(payload), time.time())
+    ).lastrowid
+
+
+def pending(conn, worksheet_name):
+    """
+    Unflushed entries (pending or failed) of one worksheet as (id, op, payload), oldest first.
+    """
+    return [(entry_id, op, json.loads(payload)) for entry_id, op, payload in conn.execute(
+        "SELECT id, op, payload FROM _journal WHERE worksheet = ? AND status != 'flushed' ORDER BY id",
+        (worksheet_name,)
+    )]
+
+
+def replay(values, entries):
+    """
+    Returns get_all_values()-style values with the entries applied in order.
+    """
+    if not entries:
+        return values
+    values = [list(row) for row in values]
+    for _, op, payload in entries:
+        if op == "append":
+            values.extend(list(row) for row in payload)
+            continue
+        for row, col, value in payload:
+            while len(values) < row:
+                values.append([])
+            target = values[row - 1]
+            if len(target) < col:
+                target.extend([""] * (col - len(target)))
+            target[col - 1] = value
+    return values
+
+
+def due(conn, now):
+    """
+    The next batch of every worksheet: its oldest unflushed entries of the same op,
+    merged up to BATCH_ROWS. A worksheet whose oldest entry failed or is waiting
+    for a retry sends nothing, so later entries never overtake it.
+    Returns [(sheet_url, worksheet, op, ids, payload), ...].
+    """
+    batches = {}
+    blocked = set()
+    for entry_id, sheet_url, worksheet_name, op, payload, status, next_attempt_at in conn.execute(
+        "SELECT id, sheet_url, worksheet, op, payload, status, next_attempt_at FROM _journal "
+        "WHERE status != 'flushed' ORDER BY id"
+    ):
+        if worksheet_name in blocked:
+            continue
+        batch = batches.get(worksheet_name)
+        if batch is None:
+            if status == "failed" or next_attempt_at > now:
+                blocked.add(worksheet_name)
+                continue
+            batches[worksheet_name] = (sheet_url, worksheet_name, op, [entry_id], json.loads(payload))
+            continue
+        if status == "failed" or next_attempt_at > now or op != batch[2] or sheet_url != batch[0] \
+                or len(batch[4]) >= BATCH_ROWS:
+            blocked.add(worksheet_name)
+            continue
+        batch[3].append(entry_id)
+        batch[4].extend(json.loads(payload))
+    return list(batches.values())
+
+
+def update_ranges(cells):
+    """
+    batch_update data for [row, col, value] cells: one range per run of consecutive rows
+    in a column. Later cells win over earlier ones for the same position.
+    """
+    columns = {}
+    for row, col, value in cells:
+        columns.setdefault(col, {})[row] = value
+    return [
+        {"range": f"{rowcol_to_a1(start, col)}:{rowcol_to_a1(end, col)}",
+         "values": [[values_by_row[r]] for r in range(start, end + 1)]}
+        for col, values_by_row in sorted(columns.items())
+        for start, end in contiguous_runs(values_by_row)
+    ]
+
+
+def send(ws, op, payload):
+    if op == "append":
+        ws.append_rows(payload, value_input_option="USER_ENTERED")
+    else:
+        ws.batch_update(update_ranges(payload), value_input_option="USER_ENTERED")
+
+
+def _placeholders(ids):
+    return ", ".join(["?"] * len(ids))
+
+
+def mark_flushed(conn, ids):
+    conn.execute(
+        f"UPDATE _journal SET status = 'flushed', flushed_at = ?, last_error = NULL WHERE id IN ({_placeholders(ids)})",
+        [time.time()] + list(ids)
+    )
+
+
+def _status(error):
+    # QuotaExceededError wraps the last throttled response as its cause
+    response = getattr(error, "response", None) or getattr(error.__cause__, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _permanent(error):
+    # Rejected requests (4xx other than throttling) fail the same way on every retry
+    status = _status(error)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def _maybe_applied(op, error):
+    # Only a throttled append surely did not land; after a timeout, connection error or 5xx
+    # the rows may already be in the sheet and resending would duplicate them
+    return op == "append" and _status(error) != 429
+
+
+def mark_failed(conn, ids, error, op="update"):
+    """
+    Schedules the entries for another attempt with exponential backoff, or marks them
+    failed once MAX_ATTEMPTS is reached, the error is permanent, or an append may have
+    landed anyway (the user checks the sheet, then retries or discards).
+    """
+    attempts = conn.execute(
+        f"SELECT MAX(attempts) FROM _journal WHERE id IN ({_placeholders(ids)})", list(ids)
+    ).fetchone()[0] + 1
+    failed = _permanent(error) or _maybe_applied(op, error) or attempts >= MAX_ATTEMPTS
+    conn.execute(
+        f"UPDATE _journal SET attempts = ?, last_error = ?, status = ?, next_attempt_at = ? "
+        f"WHERE id IN ({_placeholders(ids)})",
+        [attempts, str(error) or type(error).__name__, "failed" if failed else "pending",
+         time.time() + min(RETRY_MAX, RETRY_BASE * 2 ** (attempts - 1))] + list(ids)
+    )
+    return failed
+
+
+def retry_failed(conn):
+    return conn.execute(
+        "UPDATE _journal SET status = 'pending', attempts = 0, next_attempt_at = 0 WHERE status = 'failed'"
+    ).rowcount
+
+
+def discard_failed(conn):
+    """
+    Deletes failed entries. Returns the worksheets they belonged to.
+    """
+    worksheets = [name for (name,) in conn.execute("SELECT DISTINCT worksheet FROM _journal WHERE status = 'failed'")]
+    conn.execute("DELETE FROM _journal WHERE status = 'failed'")
+    return worksheets
+
+
+def prune(conn, now):
+    conn.execute("DELETE FROM _journal WHERE status = 'flushed' AND flushed_at < ?", (now - KEEP_FLUSHED,))
+
+
+def status(conn):
+    """
+    Returns {"pending", "failed", "flushed", "oldest_pending", "errors"} for the status panel.
+    """
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM _journal GROUP BY status").fetchall())
+    oldest = conn.execute("SELECT MIN(created_at) FROM _journal WHERE status = 'pending'").fetchone()[0]
+    errors = conn.execute(
+        "SELECT id, worksheet, op, attempts, last_error FROM _journal "
+        "WHERE last_error IS NOT NULL AND status != 'flushed' ORDER BY id LIMIT 20"
+    ).fetchall()
+    return {
+        "pending": counts.get("pending", 0),
+        "failed": counts.get("failed", 0),
+        "flushed": counts.get("flushed", 0),
+        "oldest_pending": oldest,
+        "errors": errors,
+    }
+
+
+def render_status(status, on_retry, on_discard):
+    """
+    Caption with the pending/flushed counts; failed writes get a warning with retry and discard buttons.
+    """
+    if not (status["pending"] or status["failed"] or status["flushed"]):
+        return
+    waiting = ""
+    if status["oldest_pending"]:
+        waiting = f" (oldest {time.time() - status['oldest_pending']:.0f}s ago)"
+    st.caption(f"📝 Sheets writes · {status['pending']} pending{waiting} · {status['flushed']} flushed in the last 24h")
+    if status["failed"]:
+        st.warning(f"⚠️ {status['failed']} queued write{'s' if status['failed'] != 1 else ''} could not be saved to "
+                   "Google Sheets. They are kept locally until you retry or discard them.")
+        with st.expander("🧾 Failed Writes"):
+            st.caption("Appends that timed out may already be in the sheet: check it before retrying, "
+                       "or discard them if the rows are there.")
+            st.dataframe(
+                [dict(zip(["id", "worksheet", "op", "attempts", "error"], error)) for error in status["errors"]],
+                use_container_width=True, hide_index=True
+            )
+        retry_col, discard_col = st.columns(2)
+        with retry_col:
+            st.button("🔁 Retry Failed Writes", on_click=on_retry)
+        with discard_col:
+            st.button("🗑️ Discard Failed Writes", on_click=on_discard)
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import random
+import threading
+import requests
+import gspread
+from gspread.utils import a1_to_rowcol, a1_range_to_grid_range
+from utils.timing import record_api_call
+
+# === Local Sheets Backend ===
+# An offline stand-in for the handful of gspread Spreadsheet/Worksheet methods this app
+# uses. Selected with COFI_SHEETS_BACKEND=local; data lives in memory or in a JSON file
+# and every call counts as one API request, with optional simulated latency and 429s.
+STORE_PATH = os.getenv(
+    "COFI_LOCAL_SHEETS_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "local_sheets.json")
+)
+
+DEFAULT_HEADERS = {
+    "bank_transactions": [
+        "account_number", "txn_timestamp", "amount", "current_balance", "type", "reference", "merchant",
+        "category_icon_name", "category", "bank_name", "notes", "person", "date", "time", "my_category"
+    ],
+    "credit_card": [
+        "card_number", "card_name", "txn_timestamp", "amount", "type", "merchant",
+        "category_icon_name", "category", "notes", "person", "date", "time", "my_category"
+    ],
+    "budget": ["month_year", "person", "category", "budgeted"],
+    "income": ["month_year", "person", "category", "income"],
+    "savings": ["txn_timestamp", "description", "amount", "allocated_to", "txn_id"],
+}
+
+settings = {
+    "latency_ms": float(os.getenv("COFI_LOCAL_LATENCY_MS", "0")),
+    "quota_per_minute": int(os.getenv("COFI_LOCAL_QUOTA_PER_MINUTE", "0")),  # 0 = unlimited
+    "error_rate": float(os.getenv("COFI_LOCAL_ERROR_RATE", "0")),           # chance of a 429 per request
+}
+stats = {"requests": 0, "reads": 0, "writes": 0, "throttled": 0, "cells_read": 0}
+
+_lock = threading.RLock()
+_spreadsheets = {}
+_request_times = []
+
+
+def configure(**overrides):
+    """
+    Changes simulated latency_ms / quota_per_minute / error_rate at runtime (e.g. from a benchmark).
+    """
+    unknown = set(overrides) - set(settings)
+    if unknown:
+        raise ValueError(f"Unknown local backend settings: {', '.join(sorted(unknown))}")
+    settings.update(overrides)
+
+
+def reset_stats():
+    with _lock:
+        for key in stats:
+            stats[key] = 0
+        _request_times.clear()
+
+
+def quota_error(message="Quota exceeded for quota metric 'Requests' (simulated)"):
+    response = requests.Response()
+    response.status_code = 429
+    response._content = json.dumps(
+        {"error": {"code": 429, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+    ).encode("utf-8")
+    return gspread.exceptions.APIError(response)
+
+
+def _request(kind):
+    with _lock:
+        now = time.monotonic()
+        if settings["quota_per_minute"]:
+            while _request_times and now - _request_times[0] > 60:
+                _request_times.pop(0)
+            if len(_request_times) >= settings["quota_per_minute"]:
+                stats["throttled"] += 1
+                raise quota_error()
+        if settings["error_rate"] and random.random() < settings["error_rate"]:
+            stats["throttled"] += 1
+            raise quota_error()
+        _request_times.append(now)
+        stats["requests"] += 1
+        stats[kind] += 1
+    record_api_call(kind.rstrip("s"))
+    if settings["latency_ms"]:
+        time.sleep(settings["latency_ms"] / 1000)
+
+
+def _cell(value, value_input_option):
+    # Sheets shows 100.0 entered as a number as "100"; everything comes back as text
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = "" if value is None else str(value)
+    if value_input_option == "USER_ENTERED" and text.endswith(".0") and text[:-2].lstrip("-").isdigit():
+        text = text[:-2]
+    return text
+
+
+class LocalWorksheet:
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.title = title
+
+    @property
+    def id(self):
+        return list(self.spreadsheet.data).index(self.title)
+
+    @property
+    def _rows(self):
+        return self.spreadsheet.data[self.title]
+
+    @property
+    def col_count(self):
+        return max([len(row) for row in self._rows] + [26])
+
+    @property
+    def row_count(self):
+        return max(len(self._rows), 1000)
+
+    def _trimmed(self):
+        rows = [list(row) for row in self._rows]
+        while rows and not any(rows[-1]):
+            rows.pop()
+        width = max([len(row) for row in rows] + [0])
+        return [row + [""] * (width - len(row)) for row in rows]
+
+    # --- Reads ---
+    def get_all_values(self):
+        _request("reads")
+        with _lock:
+            values = self._trimmed()
+            stats["cells_read"] += sum(len(row) for row in values)
+            return values
+
+    def get_all_records(self):
+        values = self.get_all_values()
+        if not values:
+            return []
+        header = values[0]
+        return [dict(zip(header, gspread.utils.numericise_all(row))) for row in values[1:]]
+
+    def row_values(self, row):
+        _request("reads")
+        with _lock:
+            values = self._rows[row - 1] if len(self._rows) >= row else []
+            values = list(values)
+            while values and values[-1] == "":
+                values.pop()
+            return values
+
+    def batch_get(self, ranges, **kwargs):
+        """
+        Values of each A1 range (e.g. "1:1", "A5:O"), as the API returns them: trailing
+        empty rows and cells are left out.
+        """
+        _request("reads")
+        results = []
+        with _lock:
+            for a1_range in ranges:
+                grid = a1_range_to_grid_range(a1_range)
+                rows = self._rows[grid.get("startRowIndex", 0):grid.get("endRowIndex")]
+                values = []
+                for row in rows:
+                    row = list(row[grid.get("startColumnIndex", 0):grid.get("endColumnIndex")])
+                    while row and row[-1] == "":
+                        row.pop()
+                    values.append(row)
+                while values and not values[-1]:
+                    values.pop()
+                stats["cells_read"] += sum(len(row) for row in values)
+                results.append(values)
+        return results
+
+    # --- Writes ---
+    def _set(self, row, col, value):
+        rows = self._rows
+        while len(rows) < row:
+            rows.append([])
+        while len(rows[row - 1]) < col:
+            rows[row - 1].append("")
+        rows[row - 1][col - 1] = value
+
+    def append_rows(self, values, value_input_option="RAW", **kwargs):
+        _request("writes")
+        with _lock:
+            start = len(self._trimmed()) + 1
+            for offset, row in enumerate(values):
+                for col, value in enumerate(row, start=1):
+                    self._set(start + offset, col, _cell(value, value_input_option))
+            self.spreadsheet.save()
+
+    def append_row(self, values, value_input_option="RAW", **kwargs):
+        self.append_rows([values], value_input_option=value_input_option)
+
+    def update_cell(self, row, col, value):
+        _request("writes")
+        with _lock:
+            self._set(row, col, _cell(value, "USER_ENTERED"))
+            self.spreadsheet.save()
+
+    def batch_update(self, data, value_input_option="RAW", **kwargs):
+        _request("writes")
+        with _lock:
+            for entry in data:
+                start = entry["range"].split(":")[0]
+                row, col = a1_to_rowcol(start)
+                for r_offset, values in enumerate(entry["values"]):
+                    for c_offset, value in enumerate(values):
+                        self._set(row + r_offset, col + c_offset, _cell(value, value_input_option))
+            self.spreadsheet.save()
+
+    def add_cols(self, cols):
+        _request("writes")
+
+
+class LocalSpreadsheet:
+    def __init__(self, url, data, path):
+        self.url = url
+        self.data = data
+        self.path = path
+
+    def worksheets(self):
+        _request("reads")
+        with _lock:
+            return [LocalWorksheet(self, title) for title in self.data]
+
+    def worksheet(self, title):
+        _request("reads")
+        with _lock:
+            if title not in self.data:
+                raise gspread.WorksheetNotFound(title)
+            return LocalWorksheet(self, title)
+
+    def add_worksheet(self, title, rows=1000, cols=26, index=None):
+        _request("writes")
+        with _lock:
+            if title in self.data:
+                raise ValueError(f"A sheet with the name \"{title}\" already exists.")
+            self.data[title] = []
+            self.save()
+            return LocalWorksheet(self, title)
+
+    def batch_update(self, body):
+        """
+        Spreadsheet-level batchUpdate; only deleteDimension (rows) is supported.
+        """
+        _request("writes")
+        with _lock:
+            titles = list(self.data)
+            for request in body["requests"]:
+                grid = request["deleteDimension"]["range"]
+                if grid["dimension"] != "ROWS":
+                    raise ValueError("Only row deletions are supported by the local backend.")
+                del self.data[titles[grid["sheetId"]]][grid["startIndex"]:grid["endIndex"]]
+            self.save()
+        return {"replies": [{} for _ in body["requests"]]}
+
+    def save(self):
+        if not self.path:
+            return
+        with _lock:
+            everything = {}
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    everything = json.load(f)
+            everything[self.url] = self.data
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(everything, f)
+            os.replace(tmp_path, self.path)
+
+
+def open_spreadsheet(sheet_url, path=None):
+    """
+    Returns the local spreadsheet for sheet_url, creating the app's worksheets with their
+    headers on first use. path=":memory:" keeps everything in memory.
+    """
+    path = STORE_PATH if path is None else path
+    path = None if path == ":memory:" else path
+    with _lock:
+        key = (sheet_url, path)
+        if key not in _spreadsheets:
+            data = None
+            if path and os.path.exists(path):
+                with open(path) as f:
+                    data = json.load(f).get(sheet_url)
+            if data is None:
+                data = {name: [list(header)] for name, header in DEFAULT_HEADERS.items()}
+            if path:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            _spreadsheets[key] = LocalSpreadsheet(sheet_url, data, path)
+            _spreadsheets[key].save()
+        return _spreadsheets[key]
@@ -0,0 +1,52 @@
+import re
+import pandas as pd
+
+# === Year Partitions ===
+# bank_transactions and credit_card can be split by year: the base worksheet keeps the open
+# years (and anything imported later), and every archived year moves to its own worksheet
+# named "<base>_<year>". Each partition is mirrored like any other worksheet; the aggregate
+# cube, balance index and fingerprint index cover all partitions of a base, while raw-row
+# loaders take a date range and only sync and read the partitions that overlap it.
+PARTITIONED = ("bank_transactions", "credit_card")
+_ARCHIVE = re.compile(r"^(%s)_(\d{4})$" % "|".join(PARTITIONED))
+
+
+def archive_name(base, year):
+    return f"{base}_{int(year)}"
+
+
+def archive_glob(base):
+    """
+    SQLite GLOB pattern matching the archive partitions of base.
+    """
+    return f"{base}_[0-9][0-9][0-9][0-9]"
+
+
+def parse(worksheet_name):
+    """
+    Returns (base, year) for an archive partition, (worksheet_name, None) otherwise.
+    """
+    found = _ARCHIVE.match(worksheet_name)
+    if found is None:
+        return worksheet_name, None
+    return found.group(1), int(found.group(2))
+
+
+def base_of(worksheet_name):
+    return parse(worksheet_name)[0]
+
+
+def is_archive(worksheet_name):
+    return parse(worksheet_name)[1] is not None
+
+
+def select(base, archived_years, start=None, end=None):
+    """
+    Partitions to read for rows with start <= txn_timestamp < end (either may be None), oldest
+    first: every archived year that overlaps the range, then the base worksheet, which is always read.
+    """
+    first = None if start is None else pd.Timestamp(start).year
+    last = None if end is None else (pd.Timestamp(end) - pd.Timedelta(1, "ns")).year
+    years = [year for year in sorted(archived_years)
+             if (first is None or year >= first) and (last is None or year <= last)]
+    return [archive_name(base, year) for year in years] + [base]
@@ -0,0 +1,77 @@
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+
+# === Rule Config ===
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "config.json")
+DEFAULT_FIELDS = ["merchant", "reference", "notes", "category"]
+
+_cache = {}
+
+
+def compile_rules(rules, fields=DEFAULT_FIELDS):
+    """
+    Compiles an ordered list of {"category", "pattern", optional "field"} rules into one regex
+    per field, holding the rules that apply to it (scoped to it, or unscoped). Each rule becomes
+    a lookahead alternative anchored at the start of the field's value, so a pattern only ever
+    sees one field and the first rule (in config order) that matches in any field wins.
+    """
+    alternatives = {field: [] for field in fields}
+    for i, rule in enumerate(rules):
+        re.compile(rule["pattern"])  # surface a bad pattern with its own error message
+        field = rule.get("field")
+        if field and field not in fields:
+            raise ValueError(f"Rule {i} targets unknown field '{field}'. Known fields: {', '.join(fields)}")
+        for target in [field] if field else fields:
+            alternatives[target].append(f"(?=.*?(?:{rule['pattern']}))(?P<r{i}>)")
+
+    return {
+        "regex": {
+            field: re.compile("^(?:" + "|".join(alts) + ")", re.IGNORECASE | re.DOTALL)
+            for field, alts in alternatives.items() if alts
+        },
+        "categories": [rule["category"] for rule in rules],
+        "fields": list(fields),
+    }
+
+
+def load_rules(path=CONFIG_PATH):
+    """
+    Reads "categorization_rules" from data/config.json and compiles them, recompiling only when the file changes.
+    """
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    cached = _cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    config = {}
+    if mtime is not None:
+        with open(path) as f:
+            text = f.read().strip()
+        config = json.loads(text) if text else {}
+    section = config.get("categorization_rules", {})
+    matcher = compile_rules(section.get("rules", []), section.get("fields", DEFAULT_FIELDS))
+    _cache[path] = (mtime, matcher)
+    return matcher
+
+
+def categorize(df: pd.DataFrame, matcher) -> pd.Series:
+    """
+    Returns the matched category for every row of df (NaN where no rule matches) in one vectorized pass.
+    """
+    if not matcher["regex"] or df.empty:
+        return pd.Series(pd.NA, index=df.index, dtype="object")
+
+    # Lowest matching rule number per row across fields; len(categories) means no match
+    none = len(matcher["categories"])
+    first = np.full(len(df), none)
+    for field, regex in matcher["regex"].items():
+        values = df[field].fillna("").astype(str) if field in df.columns else pd.Series("", index=df.index)
+        hits = values.str.extract(regex).notna().values
+        rule_numbers = np.array([int(name[1:]) for name in regex.groupindex])
+        first = np.minimum(first, np.where(hits.any(axis=1), rule_numbers[hits.argmax(axis=1)], none))
+
+    categories = pd.Series(matcher["categories"] + [pd.NA], dtype="object").iloc[first].values
+    return pd.Series(categories, index=df.index, dtype="object")
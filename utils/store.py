@@ -0,0 +1,1035 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from utils import aggregates, balances, journal, partitions
+from utils.transaction import FINGERPRINT_COLS, row_fingerprint, parse_timestamps, normalise_value
+from gspread.utils import numericise_all, rowcol_to_a1
+from utils.gsheet import get_worksheet, cache_header, worksheet_titles, add_worksheet, delete_rows, contiguous_runs
+from utils.timing import stage, timed, bound
+
+# === Store Config ===
+SHEET_URL = "https://docs.google.com/spreadsheets/d/1C2IwUJSB30tbfu1dbR-_PKRVeSePcGq7fpLxMqtTa1w"
+DB_PATH = os.getenv(
+    "COFI_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cofi.db")
+)
+SYNC_TTL = int(os.getenv("COFI_SYNC_TTL", "300"))  # seconds before a mirror is re-synced
+FULL_SYNC_TTL = int(os.getenv("COFI_FULL_SYNC_TTL", "1800"))  # seconds between full reloads of a worksheet
+ARCHIVE_TTL = int(os.getenv("COFI_ARCHIVE_TTL", "86400"))  # archived years only change when a year is archived
+WORKSHEETS = ["bank_transactions", "credit_card", "budget", "income", "savings"]
+FETCH_WORKERS = 5
+
+WRITE_BEHIND = os.getenv("COFI_WRITE_BEHIND", "1") != "0"  # "0" sends queued writes before returning
+WRITE_DELAY = float(os.getenv("COFI_WRITE_DELAY", "0.5"))   # seconds a write waits for others to batch with
+WRITE_POLL = 5  # seconds between checks for retries that came due
+
+logger = logging.getLogger("cofi.store")
+
+# _sync_meta.stale: STALE_FULL means rows above the watermark changed, so the next sync reloads everything
+STALE, STALE_FULL = 1, 2
+
+_sync_locks = {}  # worksheet_name -> Lock; different worksheets sync concurrently
+_sync_locks_guard = threading.Lock()
+
+_writer = None
+_writer_guard = threading.Lock()
+_flush_lock = threading.Lock()  # one flusher at a time keeps each worksheet's entries in order
+_wake = threading.Event()
+
+
+class RowsMovedError(RuntimeError):
+    pass
+
+
+# --- Connection ---
+def connect():
+    """
+    Opens a connection to the local mirror. Streamlit reruns run on separate threads,
+    so every caller gets its own short-lived connection.
+    """
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS _sync_meta (
+            worksheet TEXT PRIMARY KEY,
+            header TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            synced_at REAL NOT NULL,
+            stale INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS _import_checkpoints (
+            import_id TEXT PRIMARY KEY,
+            worksheet TEXT NOT NULL,
+            chunks_committed INTEGER NOT NULL,
+            rows_committed INTEGER NOT NULL,
+            done INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL NOT NULL
+        )
+    """)
+    _ensure_fingerprints(conn)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS _watermarks (
+            worksheet TEXT PRIMARY KEY,
+            fetched_rows INTEGER NOT NULL,
+            full_synced_at REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS _versions (
+            worksheet TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """)
+    aggregates.ensure_schema(conn)
+    balances.ensure_schema(conn)
+    journal.ensure_schema(conn)
+    return conn
+
+
+def _table(worksheet_name):
+    return f'"ws_{worksheet_name}"'
+
+
+def _row_hash(row):
+    return hashlib.sha1(json.dumps(row, default=str).encode("utf-8")).hexdigest()
+
+
+def _get_meta(conn, worksheet_name):
+    cur = conn.execute(
+        "SELECT header, row_count, synced_at, stale FROM _sync_meta WHERE worksheet = ?",
+        (worksheet_name,)
+    )
+    found = cur.fetchone()
+    if found is None:
+        return None
+    header, row_count, synced_at, stale = found
+    return {"header": json.loads(header), "row_count": row_count, "synced_at": synced_at,
+            "stale": bool(stale), "full": stale == STALE_FULL}
+
+
+def _create_table(conn, worksheet_name, width):
+    # Columns are positional (c0..cN) so sheet headers never need SQL quoting;
+    # the real header is kept in _sync_meta and applied when loading.
+    cols = ", ".join(f"c{i}" for i in range(width))
+    conn.execute(f"DROP TABLE IF EXISTS {_table(worksheet_name)}")
+    conn.execute(
+        f"CREATE TABLE {_table(worksheet_name)} (_row INTEGER PRIMARY KEY, _hash TEXT NOT NULL"
+        + (f", {cols}" if cols else "") + ")"
+    )
+
+
+# --- Fingerprint Index ---
+# n counts the rows sharing a fingerprint: two genuine identical charges are two rows,
+# and an import only skips as many copies of a transaction as the sheet already holds.
+def _ensure_fingerprints(conn):
+    def columns():
+        return [info[1] for info in conn.execute("PRAGMA table_info(_fingerprints)")]
+
+    if "n" in columns():
+        return
+    conn.execute("BEGIN IMMEDIATE")  # another connection may be migrating at the same time
+    with conn:
+        existed = columns()
+        if "n" in existed:
+            return
+        conn.execute("DROP TABLE IF EXISTS _fingerprints")
+        conn.execute("""
+            CREATE TABLE _fingerprints (
+                worksheet TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                PRIMARY KEY (worksheet, fingerprint)
+            ) WITHOUT ROWID
+        """)
+        if not existed:
+            return
+        # Indexes from before the counts existed are rebuilt from the mirrors once
+        for worksheet_name, header in conn.execute("SELECT worksheet, header FROM _sync_meta").fetchall():
+            if partitions.base_of(worksheet_name) in FINGERPRINT_COLS:
+                _index_fingerprints(conn, worksheet_name, json.loads(header))
+
+
+def _insert_fingerprints(conn, worksheet_name, fingerprints):
+    conn.executemany(
+        "INSERT INTO _fingerprints (worksheet, fingerprint, n) VALUES (?, ?, ?) "
+        "ON CONFLICT (worksheet, fingerprint) DO UPDATE SET n = n + excluded.n",
+        [(worksheet_name, fp, count) for fp, count in Counter(fingerprints).items()]
+    )
+
+
+def _index_fingerprints(conn, worksheet_name, header):
+    conn.execute("DELETE FROM _fingerprints WHERE worksheet = ?", (worksheet_name,))
+    _insert_fingerprints(conn, worksheet_name, [
+        row_fingerprint(worksheet_name, dict(zip(header, list(row)[2:])))
+        for row in conn.execute(f"SELECT * FROM {_table(worksheet_name)}")
+    ])
+
+
+def known_fingerprints(worksheet_name, fingerprints):
+    """
+    Returns a Counter of how many rows of the worksheet and its archived years carry each of
+    the fingerprints (indexed lookup per value). Rows queued for writing are already counted.
+    """
+    fingerprints = list(dict.fromkeys(fingerprints))
+    found = Counter()
+    conn = connect()
+    try:
+        for start in range(0, len(fingerprints), 500):
+            batch = fingerprints[start:start + 500]
+            placeholders = ", ".join(["?"] * len(batch))
+            found.update(dict(conn.execute(
+                f"SELECT fingerprint, SUM(n) FROM _fingerprints WHERE (worksheet = ? OR worksheet GLOB ?) "
+                f"AND fingerprint IN ({placeholders}) GROUP BY fingerprint",
+                [worksheet_name, partitions.archive_glob(worksheet_name)] + batch
+            ).fetchall()))
+    finally:
+        conn.close()
+    return found
+
+
+def _fetch_rows(conn, worksheet_name, row_numbers):
+    found = []
+    for start in range(0, len(row_numbers), 500):
+        batch = row_numbers[start:start + 500]
+        placeholders = ", ".join(["?"] * len(batch))
+        found += [list(row) for row in conn.execute(
+            f"SELECT * FROM {_table(worksheet_name)} WHERE _row IN ({placeholders})", batch
+        )]
+    return found
+
+
+def _partition_rows(conn, base, current=None, current_header=None):
+    """
+    (worksheet, header, mirror rows) of every mirrored partition of base. The header of
+    current is taken from current_header, as its sync meta is written last.
+    """
+    names = [name for (name,) in conn.execute(
+        "SELECT worksheet FROM _sync_meta WHERE worksheet = ? OR worksheet GLOB ? ORDER BY worksheet",
+        (base, partitions.archive_glob(base))
+    )]
+    if current is not None and current not in names:
+        names.append(current)
+    found = []
+    for name in names:
+        header = current_header if name == current else _get_meta(conn, name)["header"]
+        found.append((name, header, [list(row) for row in conn.execute(f"SELECT * FROM {_table(name)} ORDER BY _row")]))
+    return found
+
+
+def _mirrored_rows(conn, base):
+    return conn.execute(
+        "SELECT COALESCE(SUM(row_count), 0) FROM _sync_meta WHERE worksheet = ? OR worksheet GLOB ?",
+        (base, partitions.archive_glob(base))
+    ).fetchone()[0]
+
+
+# --- Sync ---
+def _sync_lock(worksheet_name):
+    with _sync_locks_guard:
+        return _sync_locks.setdefault(worksheet_name, threading.Lock())
+
+
+def _fit(row, width):
+    return row[:width] + [""] * (width - len(row))
+
+
+def _write_changes(conn, worksheet_name, header, meta, changed, row_count, rebuilt, synced=True):
+    """
+    Writes changed mirror rows ([row_number, hash, *values]), drops rows past row_count and
+    updates the fingerprint index, aggregate cube, balance index, sync meta and data version.
+    synced=False records a local write: the mirror is not marked as freshly synced.
+    Returns the number of rows deleted.
+    """
+    previous_count = meta["row_count"] if meta and not rebuilt else 0
+
+    # Old versions of rows about to be overwritten or dropped, for the aggregate delta
+    if aggregates.is_source(worksheet_name) and not rebuilt:
+        replaced = [entry[0] for entry in changed if entry[0] <= previous_count + 1]
+        removed_rows = _fetch_rows(conn, worksheet_name, replaced)
+        removed_rows += [list(row) for row in conn.execute(
+            f"SELECT * FROM {_table(worksheet_name)} WHERE _row > ? ORDER BY _row", (row_count + 1,)
+        )]
+        removed_rows = [row[2:] for row in removed_rows]
+
+    if changed:
+        placeholders = ", ".join(["?"] * (len(header) + 2))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {_table(worksheet_name)} VALUES ({placeholders})",
+            changed
+        )
+    deleted = conn.execute(
+        f"DELETE FROM {_table(worksheet_name)} WHERE _row > ?", (row_count + 1,)
+    ).rowcount
+
+    if partitions.base_of(worksheet_name) in FINGERPRINT_COLS:
+        appended_only = previous_count > 0 and not deleted and all(
+            entry[0] > previous_count + 1 for entry in changed
+        )
+        if appended_only:
+            _insert_fingerprints(conn, worksheet_name, [
+                row_fingerprint(worksheet_name, dict(zip(header, entry[2:]))) for entry in changed
+            ])
+        else:
+            # Earlier rows were edited or removed: rebuild the index from the full mirror
+            _index_fingerprints(conn, worksheet_name, header)
+
+    if aggregates.is_source(worksheet_name):
+        if rebuilt:
+            # The old rows are gone with the old table: recount the source from all its partitions
+            aggregates.rebuild(conn, worksheet_name, [
+                (partition_header, [row[2:] for row in rows])
+                for _, partition_header, rows in _partition_rows(
+                    conn, partitions.base_of(worksheet_name), worksheet_name, header
+                )
+            ])
+        else:
+            aggregates.apply_delta(conn, worksheet_name, header, removed_rows,
+                                   [entry[2:] for entry in changed])
+
+    if balances.is_source(worksheet_name):
+        numbered_rows = [(entry[0], entry[2:]) for entry in changed]
+        if rebuilt:
+            balances.rebuild(conn, worksheet_name, header, numbered_rows)
+        else:
+            balances.apply_delta(conn, worksheet_name, header, numbered_rows, row_count + 1)
+
+    if synced:
+        conn.execute(
+            "INSERT OR REPLACE INTO _sync_meta (worksheet, header, row_count, synced_at, stale) "
+            "VALUES (?, ?, ?, ?, 0)",
+            (worksheet_name, json.dumps(header), row_count, time.time())
+        )
+    else:
+        conn.execute("UPDATE _sync_meta SET row_count = ? WHERE worksheet = ?", (row_count, worksheet_name))
+    if rebuilt or changed or deleted:
+        conn.execute(
+            "INSERT INTO _versions (worksheet, version) VALUES (?, 1) "
+            "ON CONFLICT (worksheet) DO UPDATE SET version = version + 1",
+            (worksheet_name,)
+        )
+    return deleted
+
+
+def _fetch_tail(conn, ws, worksheet_name):
+    """
+    Fetches the header and every row from the last one seen on (one request), for a sync
+    of a mostly append-only worksheet. Returns (header, rows after the watermark, sheet row
+    count), or None when a full reload is needed: first sync, journaled writes still queued,
+    our own edits above the watermark, FULL_SYNC_TTL elapsed, or a header or last seen row
+    that no longer matches the mirror (an edit or deletion made elsewhere).
+    """
+    meta = _get_meta(conn, worksheet_name)
+    mark = conn.execute(
+        "SELECT fetched_rows, full_synced_at FROM _watermarks WHERE worksheet = ?", (worksheet_name,)
+    ).fetchone()
+    if meta is None or mark is None or meta["full"] or not meta["header"]:
+        return None
+    fetched_rows, full_synced_at = mark
+    if time.time() - full_synced_at > FULL_SYNC_TTL or journal.pending(conn, worksheet_name):
+        return None
+
+    header = meta["header"]
+    start = fetched_rows + 1  # the last row seen (the header itself while the sheet had no rows)
+    last_col = rowcol_to_a1(1, len(header))[:-1]
+    with stage(f"sheets: fetch rows {start + 1}+ {worksheet_name}"):
+        header_values, tail = ws.batch_get(["1:1", f"A{start}:{last_col}"])
+    live_header = list(header_values[0]) if header_values else []
+    # Compared untruncated: a column added in Sheets must force a full reload
+    if _fit(live_header, len(header)) != header or len(live_header) > len(header) or not tail:
+        return None
+    if fetched_rows:
+        seen = conn.execute(f"SELECT _hash FROM {_table(worksheet_name)} WHERE _row = ?", (start,)).fetchone()
+        if seen is None or seen[0] != _row_hash(_fit(numericise_all(list(tail[0])), len(header))):
+            return None
+    rows = [list(row) for row in tail[1:]]
+    return header, rows, fetched_rows + len(rows)
+
+
+def _set_watermark(conn, worksheet_name, fetched_rows, full=False):
+    if full:
+        conn.execute(
+            "INSERT OR REPLACE INTO _watermarks (worksheet, fetched_rows, full_synced_at) VALUES (?, ?, ?)",
+            (worksheet_name, fetched_rows, time.time())
+        )
+    else:
+        conn.execute("UPDATE _watermarks SET fetched_rows = ? WHERE worksheet = ?", (fetched_rows, worksheet_name))
+
+
+@timed("sync {0}")
+def sync_worksheet(worksheet_name, sheet_url=SHEET_URL, full=False):
+    """
+    Pulls a worksheet from Google Sheets into the local mirror.
+    Usually only the rows appended since the last sync are fetched (see _fetch_tail);
+    full=True, or any sign of an edit above them, reloads the whole sheet.
+    Only rows whose content changed since the last sync are rewritten locally.
+    Returns a dict with fetched/written/deleted row counts and the fetch mode.
+    """
+    with _sync_lock(worksheet_name):
+        ws = get_worksheet(sheet_url, worksheet_name)
+        conn = connect()
+        try:
+            tail = None if full else _fetch_tail(conn, ws, worksheet_name)
+            if tail is not None:
+                header, fetched, sheet_rows = tail
+                with conn:
+                    meta = _get_meta(conn, worksheet_name)
+                    first_row = sheet_rows - len(fetched) + 2  # 1 for header row, 1 for 1-indexing
+                    existing = dict(conn.execute(
+                        f"SELECT _row, _hash FROM {_table(worksheet_name)} WHERE _row >= ?", (first_row,)
+                    ).fetchall())
+                    changed = []
+                    for offset, row in enumerate(fetched):
+                        row = _fit(numericise_all(row), len(header))
+                        row_hash = _row_hash(row)
+                        if existing.get(first_row + offset) != row_hash:
+                            changed.append([first_row + offset, row_hash] + row)
+                    deleted = _write_changes(conn, worksheet_name, header, meta, changed, sheet_rows, rebuilt=False)
+                    _set_watermark(conn, worksheet_name, sheet_rows)
+                return {"fetched": len(fetched), "written": len(changed), "deleted": deleted, "mode": "delta"}
+
+            with stage(f"sheets: get_all_values {worksheet_name}"):
+                values = ws.get_all_values()
+            with conn:
+                sheet_rows = max(len(values) - 1, 0)
+                # Writes still queued in the journal are laid over the sheet, so a sync never hides them
+                values = journal.replay(values, journal.pending(conn, worksheet_name))
+                header = values[0] if values else []
+                rows = [numericise_all(row) for row in values[1:]]
+                cache_header(sheet_url, worksheet_name, header)
+
+                meta = _get_meta(conn, worksheet_name)
+                rebuilt = meta is None or meta["header"] != header
+                if rebuilt:
+                    _create_table(conn, worksheet_name, len(header))
+                    existing = {}
+                else:
+                    existing = dict(conn.execute(f"SELECT _row, _hash FROM {_table(worksheet_name)}").fetchall())
+
+                changed = []
+                for offset, row in enumerate(rows):
+                    row_number = offset + 2  # 1 for header row, 1 for 1-indexing
+                    row = _fit(row, len(header))
+                    row_hash = _row_hash(row)
+                    if existing.get(row_number) != row_hash:
+                        changed.append([row_number, row_hash] + row)
+
+                deleted = _write_changes(conn, worksheet_name, header, meta, changed, len(rows), rebuilt)
+                _set_watermark(conn, worksheet_name, sheet_rows, full=True)
+        finally:
+            conn.close()
+
+    return {"fetched": len(rows), "written": len(changed), "deleted": deleted, "mode": "full"}
+
+
+def sync_many(worksheet_names, sheet_url=SHEET_URL, full=False):
+    """
+    Syncs several worksheets concurrently, so the wait is the slowest fetch rather than their sum.
+    Returns (results, errors): {worksheet_name: stats} and {worksheet_name: exception}.
+    """
+    worksheet_names = list(dict.fromkeys(worksheet_names))
+    results, errors = {}, {}
+    if not worksheet_names:
+        return results, errors
+    sync = bound(sync_worksheet)  # keep timing stages and API counts of the worker threads
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(worksheet_names))) as pool:
+        futures = {name: pool.submit(sync, name, sheet_url, full) for name in worksheet_names}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors[name] = e
+    return results, errors
+
+
+def sync_all(sheet_url=SHEET_URL, full=True):
+    """
+    Syncs every known worksheet and archived year, by default reloading each one in full
+    (picks up edits made directly in Google Sheets). Returns {worksheet_name: stats}; raises the first failure.
+    """
+    archives = [title for title in worksheet_titles(sheet_url, refresh=True) if partitions.is_archive(title)]
+    results, errors = sync_many(WORKSHEETS + archives, sheet_url, full)
+    if errors:
+        raise next(iter(errors.values()))
+    return results
+
+
+def _mark_stale(conn, worksheet_name, full=False):
+    conn.execute("UPDATE _sync_meta SET stale = MAX(stale, ?) WHERE worksheet = ?",
+                 (STALE_FULL if full else STALE, worksheet_name))
+
+
+def mark_stale(worksheet_name, full=False):
+    """
+    Flags a mirror as out of date so the next load re-syncs it.
+    Call this after writing to the worksheet through the Sheets API; full=True when
+    the write changed existing rows, which a fetch of appended rows would not see.
+    """
+    conn = connect()
+    try:
+        with conn:
+            _mark_stale(conn, worksheet_name, full)
+    finally:
+        conn.close()
+
+
+def data_version(worksheet_names):
+    """
+    Returns a string that changes whenever the content of any of the worksheets' mirrors changes.
+    Syncs that find nothing new keep the version, so it is safe to key caches on.
+    """
+    conn = connect()
+    try:
+        versions = dict(conn.execute("SELECT worksheet, version FROM _versions").fetchall())
+    finally:
+        conn.close()
+    keys = []
+    for name in worksheet_names:
+        keys.append(f"{name}:{versions.get(name, 0)}")
+        # Archived years count towards their base worksheet
+        keys += [f"{archive}:{version}" for archive, version in sorted(versions.items())
+                 if archive != name and partitions.base_of(archive) == name]
+    return "|".join(keys)
+
+
+def _max_age(worksheet_name, max_age):
+    return max(max_age, ARCHIVE_TTL) if partitions.is_archive(worksheet_name) else max_age
+
+
+def needs_sync(worksheet_name, max_age=SYNC_TTL):
+    max_age = _max_age(worksheet_name, max_age)
+    conn = connect()
+    try:
+        meta = _get_meta(conn, worksheet_name)
+    finally:
+        conn.close()
+    return meta is None or meta["stale"] or (time.time() - meta["synced_at"]) > max_age
+
+
+def mirror_state(worksheet_name, max_age=SYNC_TTL):
+    """
+    Returns (needs_sync, version) in one query; the version also moves on local (journaled) writes.
+    """
+    max_age = _max_age(worksheet_name, max_age)
+    conn = connect()
+    try:
+        meta = _get_meta(conn, worksheet_name)
+        found = conn.execute("SELECT version FROM _versions WHERE worksheet = ?", (worksheet_name,)).fetchone()
+    finally:
+        conn.close()
+    stale = meta is None or meta["stale"] or (time.time() - meta["synced_at"]) > max_age
+    return stale, found[0] if found else 0
+
+
+# --- Read Path ---
+@timed("load {0}")
+def load_frame(worksheet_name, max_age=SYNC_TTL, sheet_url=SHEET_URL):
+    """
+    Returns the worksheet as a DataFrame read from the local mirror, syncing first
+    only if the mirror is missing, stale or older than max_age seconds.
+    The frame index matches get_all_records() order, so row number = index + 2.
+    """
+    if needs_sync(worksheet_name, max_age):
+        sync_worksheet(worksheet_name, sheet_url)
+
+    conn = connect()
+    try:
+        meta = _get_meta(conn, worksheet_name)
+        header = meta["header"]
+        if not header:
+            return pd.DataFrame()
+        df = pd.read_sql_query(f"SELECT * FROM {_table(worksheet_name)} ORDER BY _row", conn)
+    finally:
+        conn.close()
+
+    df = df.drop(columns=["_row", "_hash"])
+    df.columns = header
+    return df
+
+
+# --- Year Partitions ---
+def archived_years(base, sheet_url=SHEET_URL):
+    """
+    Years of base that were moved to their own worksheet, oldest first (from the cached tab list).
+    """
+    return sorted(year for name, year in map(partitions.parse, worksheet_titles(sheet_url))
+                  if name == base and year is not None)
+
+
+def partition_names(base, start=None, end=None, sheet_url=SHEET_URL):
+    """
+    Worksheets holding the rows of base with start <= txn_timestamp < end; see partitions.select.
+    """
+    return partitions.select(base, archived_years(base, sheet_url), start, end)
+
+
+def sync_partitions(base, max_age=SYNC_TTL, sheet_url=SHEET_URL):
+    """
+    Syncs every partition of base whose mirror is stale; raises the first failure.
+    """
+    stale = [name for name in partition_names(base, sheet_url=sheet_url) if needs_sync(name, max_age)]
+    if stale:
+        _, errors = sync_many(stale, sheet_url)
+        if errors:
+            raise next(iter(errors.values()))
+
+
+@timed("archive {0} {1}")
+def archive_year(base, year, sheet_url=SHEET_URL):
+    """
+    Moves every row of a closed year from bank_transactions / credit_card into its own
+    worksheet ("<base>_<year>"), creating it if needed. Rows are copied and read back
+    before they are deleted from base, so an interrupted run can simply be repeated.
+    Returns {"partition": worksheet name, "archived": rows moved}.
+    """
+    if base not in partitions.PARTITIONED:
+        raise ValueError(f"❌ '{base}' is not partitioned by year.")
+    year = int(year)
+    if year >= pd.Timestamp.now().year:
+        raise ValueError(f"❌ {year} is not closed yet; only past years can be archived.")
+    name = partitions.archive_name(base, year)
+
+    # Queued writes address rows by position, so none may be in flight while rows move
+    flush_writes()
+    with _sync_lock(base):
+        conn = connect()
+        try:
+            if journal.pending(conn, base):
+                raise RuntimeError(f"⏳ Writes to '{base}' are still waiting for Google Sheets. Try again once they are saved.")
+        finally:
+            conn.close()
+
+        ws = get_worksheet(sheet_url, base)
+        with stage(f"sheets: get_all_values {base}"):
+            values = ws.get_all_values()
+        header = values[0] if values else []
+        if "txn_timestamp" not in header:
+            raise ValueError(f"❌ '{base}' has no txn_timestamp column.")
+        ts_col = header.index("txn_timestamp")
+        rows = [_fit(list(row), len(header)) for row in values[1:]]
+        years = parse_timestamps(pd.Series([row[ts_col] for row in rows], dtype="object")).dt.year
+        moved = [offset + 2 for offset, row_year in enumerate(years) if row_year == year]
+        if not moved:
+            return {"partition": name, "archived": 0}
+
+        if name in worksheet_titles(sheet_url):
+            archive = get_worksheet(sheet_url, name)
+            existing = archive.get_all_values()
+        else:
+            archive = add_worksheet(sheet_url, name, rows=len(moved) + 1, cols=len(header))
+            existing = []
+        if existing and _fit(list(existing[0]), len(header)) != header:
+            raise ValueError(f"❌ The header of '{name}' does not match '{base}'.")
+
+        def fingerprints(archived_rows):
+            return Counter(row_fingerprint(base, dict(zip(header, row))) for row in archived_rows)
+
+        # Rows copied by an earlier, interrupted run are not copied twice
+        copied = fingerprints(existing[1:])
+        to_copy = []
+        for row_number in moved:
+            fp = row_fingerprint(base, dict(zip(header, rows[row_number - 2])))
+            if copied[fp]:
+                copied[fp] -= 1
+            else:
+                to_copy.append(rows[row_number - 2])
+        if not existing:
+            to_copy.insert(0, header)
+        if to_copy:
+            archive.append_rows(to_copy, value_input_option="USER_ENTERED")
+
+        # Delete from base only what the archive really holds
+        stored = fingerprints(archive.get_all_values()[1:])
+        stored.subtract(fingerprints(rows[row_number - 2] for row_number in moved))
+        if any(count < 0 for count in stored.values()):
+            raise RuntimeError(f"❌ Copying to '{name}' could not be verified; '{base}' was left unchanged.")
+        delete_rows(sheet_url, base, moved)
+
+        conn = connect()
+        try:
+            with conn:
+                _mark_stale(conn, base, full=True)
+        finally:
+            conn.close()
+
+    _, errors = sync_many([base, name], sheet_url, full=True)
+    if errors:
+        raise next(iter(errors.values()))
+    return {"partition": name, "archived": len(moved)}
+
+
+# --- Write Path ---
+def _key_of(values, key_cols, normalizers):
+    return tuple(normalizers.get(col, lambda v: str(v).strip())(values.get(col, "")) for col in key_cols)
+
+
+@timed("upsert {0}")
+def upsert_rows(worksheet_name, rows, key_cols, normalizers=None, sheet_url=SHEET_URL):
+    """
+    Inserts or overwrites rows (list of dicts) keyed on key_cols with journaled writes.
+    Existing rows with the same key are overwritten in place (every duplicate, if any) with
+    one update, unchanged rows are skipped, and new keys are appended with one append
+    (appends grow the sheet's grid; cell updates past its last row would be rejected).
+    normalizers maps a key column to a function used to compare its values.
+    Raises RowsMovedError if the overwritten rows were sorted or deleted in Google Sheets meanwhile.
+    Returns a dict with updated/inserted counts and the id of the last journal entry (queued, None if nothing changed).
+    """
+    normalizers = normalizers or {}
+    # Rows are addressed by position, so the mirror must be current before writing
+    sync_worksheet(worksheet_name, sheet_url)
+    df = load_frame(worksheet_name, sheet_url=sheet_url)
+
+    row_numbers = {}
+    for index, existing in enumerate(df.to_dict("records")):
+        row_numbers.setdefault(_key_of(existing, key_cols, normalizers), []).append((index + 2, existing))
+
+    values_by_row, expected, appended = {}, {}, []
+    header = list(df.columns)
+    if not header and rows:
+        header = list(rows[0].keys())
+        appended.append(header)  # empty sheet: write the header too
+    updated, inserted = 0, 0
+    for row in rows:
+        matches = row_numbers.get(_key_of(row, key_cols, normalizers))
+        if matches:
+            for row_number, existing in matches:
+                new_values = [row.get(col, existing.get(col, "")) for col in header]
+                # Key columns already match after normalization; only payload changes count
+                if any(str(new) != str(existing.get(col, ""))
+                       for col, new in zip(header, new_values) if col not in key_cols):
+                    values_by_row[row_number] = new_values
+                    # Positional write after a delta sync: the row must still hold the key read
+                    expected[row_number] = {col: existing.get(col, "") for col in key_cols}
+                    updated += 1
+        else:
+            appended.append([row.get(col, "") for col in header])
+            inserted += 1
+
+    queued = None
+    if values_by_row:
+        cells = [[row_number, col, value]
+                 for row_number, values in sorted(values_by_row.items())
+                 for col, value in enumerate(values, start=1)]
+        queued = queue_update(worksheet_name, cells, sheet_url, expected)
+    if appended:
+        queued = queue_append(worksheet_name, appended, sheet_url)
+    return {"updated": updated, "inserted": inserted, "queued": queued}
+
+
+# --- Write-Behind Journal ---
+def _apply_local(conn, worksheet_name, op, payload):
+    """
+    Applies a journaled write to the mirror right away. Mirrors that were never synced, or of
+    a sheet without a header yet, are skipped: their next sync replays the journal anyway.
+    """
+    meta = _get_meta(conn, worksheet_name)
+    if meta is None or not meta["header"]:
+        return
+    header, row_count = meta["header"], meta["row_count"]
+    width = len(header)
+    numbered = {}
+    if op == "append":
+        for offset, row in enumerate(payload):
+            numbered[row_count + 2 + offset] = _fit(numericise_all(list(row)), width)
+    else:
+        # Header edits and columns the mirror does not have yet arrive with the next sync
+        cells = [(row, col, value) for row, col, value in payload if row >= 2 and col <= width]
+        current = {row[0]: list(row[2:]) for row in _fetch_rows(conn, worksheet_name, sorted({c[0] for c in cells}))}
+        for row, col, value in cells:
+            values = numbered.setdefault(row, current.get(row, [""] * width))
+            values[col - 1] = numericise_all([value])[0]
+        # Writes below the last row leave blank rows in between, as in the sheet
+        for row_number in range(row_count + 2, max(numbered, default=0)):
+            numbered.setdefault(row_number, [""] * width)
+    changed = [[row_number, _row_hash(values)] + values for row_number, values in sorted(numbered.items())]
+    row_count = max([row_count] + [row_number - 1 for row_number in numbered])
+    _write_changes(conn, worksheet_name, header, meta, changed, row_count, rebuilt=False, synced=False)
+
+
+def _verify_rows(conn, ws, worksheet_name, expected):
+    """
+    Reads the addressed rows (and the header) from Google Sheets in one request and checks
+    that each still holds the values the caller saw: expected maps row_number -> {column: value}.
+    Rows past the end of the sheet pass while writes are queued (a pending append fills them).
+    """
+    runs = contiguous_runs(expected)
+    fetched = ws.batch_get(["1:1"] + [f"{start}:{end}" for start, end in runs])
+    live_header = fetched[0][0] if fetched[0] else []
+    queued = bool(journal.pending(conn, worksheet_name))
+    for (start, end), values in zip(runs, fetched[1:]):
+        for offset, row_number in enumerate(range(start, end + 1)):
+            live = values[offset] if offset < len(values) else []
+            if not any(live) and queued:
+                continue
+            live = dict(zip(live_header, live))
+            for col, value in expected[row_number].items():
+                if normalise_value(live.get(col, "")) != normalise_value(journal.cell(value)):
+                    return False
+    return True
+
+
+def queue_write(worksheet_name, op, payload, sheet_url=SHEET_URL, expected=None):
+    """
+    Commits a sheet mutation to the journal and the local mirror, then returns without
+    waiting for Google Sheets; the writer thread sends it shortly after.
+    op "append" takes a list of rows, "update" a list of [row, col, value] cells.
+    expected ({row_number: {column: value}}, for updates computed from a loaded frame) is checked
+    against the sheet first: rows sorted or deleted in Google Sheets since the mirror was
+    synced raise RowsMovedError instead of receiving someone else's values.
+    Returns the journal entry id.
+    """
+    if op == "append":
+        payload = [[journal.cell(value) for value in row] for row in payload]
+    else:
+        payload = [[int(row), int(col), journal.cell(value)] for row, col, value in payload]
+    with _sync_lock(worksheet_name):
+        conn = connect()
+        try:
+            if expected and not _verify_rows(conn, get_worksheet(sheet_url, worksheet_name), worksheet_name, expected):
+                with conn:
+                    _mark_stale(conn, worksheet_name, full=True)
+                raise RowsMovedError(
+                    f"🔄 '{worksheet_name}' changed in Google Sheets since it was loaded. Nothing was saved; "
+                    "please review the reloaded rows and try again."
+                )
+            with conn:
+                entry_id = journal.record(conn, sheet_url, worksheet_name, op, payload)
+                _apply_local(conn, worksheet_name, op, payload)
+        finally:
+            conn.close()
+    if WRITE_BEHIND:
+        start_writer()
+        _wake.set()
+    else:
+        flush_writes()
+    return entry_id
+
+
+def queue_append(worksheet_name, rows, sheet_url=SHEET_URL):
+    return queue_write(worksheet_name, "append", rows, sheet_url)
+
+
+def queue_update(worksheet_name, cells, sheet_url=SHEET_URL, expected=None):
+    return queue_write(worksheet_name, "update", cells, sheet_url, expected)
+
+
+def _flush_batch(sheet_url, worksheet_name, op, ids, payload):
+    # Holding the sync lock keeps a sync from fetching the sheet before the write lands and
+    # then, with the entry already flushed (so not replayed), dropping it from the mirror
+    with _sync_lock(worksheet_name):
+        try:
+            journal.send(get_worksheet(sheet_url, worksheet_name), op, payload)
+        except Exception as e:
+            conn = connect()
+            try:
+                with conn:
+                    journal.mark_failed(conn, ids, e, op)
+            finally:
+                conn.close()
+            return False
+        conn = connect()
+        try:
+            with conn:
+                journal.mark_flushed(conn, ids)
+                # Re-read what Sheets stored (formulas, formatting) on the next load
+                _mark_stale(conn, worksheet_name, full=op == "update")
+        finally:
+            conn.close()
+    return True
+
+
+def flush_writes():
+    """
+    Sends every journal entry that is due, one request per batch, until none are left.
+    Returns {"batches": sent, "entries": flushed, "failures": failed attempts}.
+    """
+    stats = {"batches": 0, "entries": 0, "failures": 0}
+    with _flush_lock:
+        while True:
+            conn = connect()
+            try:
+                with conn:
+                    journal.prune(conn, time.time())
+                    batches = journal.due(conn, time.time())
+            finally:
+                conn.close()
+            if not batches:
+                return stats
+            for sheet_url, worksheet_name, op, ids, payload in batches:
+                if _flush_batch(sheet_url, worksheet_name, op, ids, payload):
+                    stats["batches"] += 1
+                    stats["entries"] += len(ids)
+                else:
+                    stats["failures"] += 1
+
+
+def _write_loop():
+    while True:
+        _wake.wait(timeout=WRITE_POLL)
+        _wake.clear()
+        time.sleep(WRITE_DELAY)  # let a burst of writes go out as one batch
+        try:
+            flush_writes()
+        except Exception:
+            logger.exception("Journal flush failed")
+
+
+def start_writer():
+    """
+    Starts the background writer once per process. Entries left by a previous process are sent too.
+    """
+    global _writer
+    with _writer_guard:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_write_loop, name="cofi-journal-writer", daemon=True)
+            _writer.start()
+            _wake.set()
+
+
+def write_status():
+    """
+    Journal counts for the status panel: pending, failed, flushed (last 24h), oldest_pending, errors.
+    """
+    conn = connect()
+    try:
+        status = journal.status(conn)
+    finally:
+        conn.close()
+    if status["pending"] and WRITE_BEHIND:
+        start_writer()
+    return status
+
+
+def retry_writes():
+    conn = connect()
+    try:
+        with conn:
+            journal.retry_failed(conn)
+    finally:
+        conn.close()
+    _wake.set()
+
+
+def discard_writes():
+    """
+    Drops failed journal entries; their worksheets are re-synced from Google Sheets.
+    """
+    conn = connect()
+    try:
+        with conn:
+            for worksheet_name in journal.discard_failed(conn):
+                _mark_stale(conn, worksheet_name, full=True)
+    finally:
+        conn.close()
+
+
+# --- Import Checkpoints ---
+def get_checkpoint(import_id):
+    """
+    Returns {worksheet, chunks_committed, rows_committed, done} for an upload, or None.
+    """
+    conn = connect()
+    try:
+        found = conn.execute(
+            "SELECT worksheet, chunks_committed, rows_committed, done FROM _import_checkpoints WHERE import_id = ?",
+            (import_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if found is None:
+        return None
+    worksheet, chunks_committed, rows_committed, done = found
+    return {"worksheet": worksheet, "chunks_committed": chunks_committed,
+            "rows_committed": rows_committed, "done": bool(done)}
+
+
+def save_checkpoint(import_id, worksheet_name, chunks_committed, rows_committed, done=False):
+    conn = connect()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO _import_checkpoints "
+                "(import_id, worksheet, chunks_committed, rows_committed, done, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (import_id, worksheet_name, chunks_committed, rows_committed, int(done), time.time())
+            )
+    finally:
+        conn.close()
+
+
+def clear_checkpoint(import_id):
+    conn = connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM _import_checkpoints WHERE import_id = ?", (import_id,))
+    finally:
+        conn.close()
+
+
+# --- Aggregates ---
+@timed("load monthly cube")
+def load_cube(max_age=SYNC_TTL, sheet_url=SHEET_URL):
+    """
+    Returns the monthly aggregate cube (source, person, month, my_category, type, amount, txn_count)
+    for bank and credit card transactions, syncing the underlying mirrors first if needed.
+    """
+    for worksheet_name in aggregates.CUBE_SOURCES:
+        sync_partitions(worksheet_name, max_age, sheet_url)
+
+    conn = connect()
+    try:
+        with conn:
+            for worksheet_name in aggregates.CUBE_SOURCES:
+                # Mirrors synced before the cube existed are folded in once
+                if aggregates.has_source(conn, worksheet_name) or not _mirrored_rows(conn, worksheet_name):
+                    continue
+                aggregates.rebuild(conn, worksheet_name, [
+                    (header, [row[2:] for row in rows]) for _, header, rows in _partition_rows(conn, worksheet_name)
+                ])
+        return aggregates.read_cube(conn)
+    finally:
+        conn.close()
+
+
+# --- Balances ---
+def _balance_conn(max_age, sheet_url):
+    sync_partitions(balances.WORKSHEET, max_age, sheet_url)
+    conn = connect()
+    with conn:
+        # Mirrors synced before the balance index existed are indexed once
+        if balances.is_empty(conn):
+            for name, header, rows in _partition_rows(conn, balances.WORKSHEET):
+                balances.rebuild(conn, name, header, [(row[0], row[2:]) for row in rows])
+    return conn
+
+
+@timed("load latest balances")
+def load_latest_balances(max_age=SYNC_TTL, sheet_url=SHEET_URL):
+    """
+    Returns the latest balance of every bank account (account_number, day, balance), newest first.
+    """
+    conn = _balance_conn(max_age, sheet_url)
+    try:
+        return balances.latest_balances(conn)
+    finally:
+        conn.close()
+
+
+@timed("load net worth")
+def load_net_worth(freq="M", max_age=SYNC_TTL, sheet_url=SHEET_URL):
+    """
+    Returns net worth over time (date, net_worth) per day ("D") or month end ("M").
+    """
+    conn = _balance_conn(max_age, sheet_url)
+    try:
+        return balances.net_worth(conn, freq)
+    finally:
+        conn.close()
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+import pandas as pd
+import streamlit as st
+
+# === Page Timing ===
+# Each rerun records a flat list of (possibly nested) stages with their wall time and the
+# number of Sheets API requests issued inside them. The run belongs to the script thread,
+# so concurrent sessions never mix; code running outside a run (e.g. benchmarks) is untimed.
+LOG_ENABLED = os.getenv("COFI_TIMING_LOG", "1") != "0"
+
+logger = logging.getLogger("cofi.timing")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_local = threading.local()
+
+
+class PageRun:
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.stages = []
+        self.api_calls = {}
+        self.seconds = None
+        self.lock = threading.Lock()  # worker threads record into the same run
+
+    @property
+    def api_total(self):
+        return sum(self.api_calls.values())
+
+
+def start_run(page):
+    """
+    Starts timing a rerun of page on the current thread. Called once at the top of home.py.
+    """
+    _local.run = PageRun(page)
+    _local.depth = 0
+    return _local.run
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the enclosed block as one stage of the current run (no-op outside a run).
+    """
+    run = current_run()
+    if run is None:
+        yield
+        return
+    depth = getattr(_local, "depth", 0)
+    entry = {"stage": name, "depth": depth, "seconds": None, "api_calls": 0}
+    with run.lock:
+        run.stages.append(entry)
+    calls_before = run.api_total
+    _local.depth = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        entry["seconds"] = round(time.perf_counter() - started, 4)
+        entry["api_calls"] = run.api_total - calls_before
+
+
+def timed(label):
+    """
+    Decorator form of stage(). label is formatted with the call's arguments, e.g. "sync {0}".
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(label.format(*args, **kwargs)):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def bound(fn):
+    """
+    Wraps fn so that, when called on a worker thread, it records into the calling thread's run.
+    """
+    run, depth = current_run(), getattr(_local, "depth", 0)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        _local.run, _local.depth = run, depth
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.run, _local.depth = None, 0
+    return wrapper
+
+
+def record_api_call(kind):
+    """
+    Counts one Sheets API request ("read" or "write") against the current run.
+    """
+    run = current_run()
+    if run is not None:
+        with run.lock:
+            run.api_calls[kind] = run.api_calls.get(kind, 0) + 1
+
+
+def finish_run():
+    """
+    Closes the current run and emits it as one JSON log line. Returns the run (or None).
+    """
+    run = current_run()
+    if run is None:
+        return None
+    _local.run = None
+    run.seconds = round(time.perf_counter() - run.started, 4)
+    if LOG_ENABLED:
+        logger.info(json.dumps({
+            "event": "page_timing",
+            "page": run.page,
+            "seconds": run.seconds,
+            "api_calls": run.api_total,
+            "api_calls_by_kind": run.api_calls,
+            "stages": run.stages,
+        }))
+    return run
+
+
+def render_panel(run):
+    if run is None:
+        return
+    with st.expander(f"⏱️ Timing · {run.seconds:.2f}s · {run.api_total} Sheets API calls"):
+        if not run.stages:
+            st.caption("No timed stages in this run.")
+            return
+        table = pd.DataFrame(run.stages)
+        table["stage"] = [" " * depth + name for depth, name in zip(table["depth"], table["stage"])]
+        st.dataframe(table.drop(columns=["depth"]), use_container_width=True, hide_index=True)
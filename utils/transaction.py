@@ -0,0 +1,104 @@
+import hashlib
+import warnings
+import pandas as pd
+from utils.partitions import base_of
+
+# === Transaction Schema ===
+# One schema for bank_transactions and credit_card rows. Low-cardinality text becomes
+# categorical, txn_timestamp becomes datetime64 (UTC, tz-naive) and money columns are
+# downcast to the smallest integer type when every value is whole rupees. Fractional
+# amounts stay float64: float32 cannot hold paise exactly, which breaks sums and joins.
+CATEGORICAL_COLS = ["type", "person", "bank_name", "card_name", "my_category", "account_number", "card_number"]
+UPPER_COLS = ["type"]
+NUMERIC_COLS = ["amount", "current_balance"]
+TIMESTAMP_COL = "txn_timestamp"
+AUTO_CATEGORY_RATIO = 0.5  # other text columns become categorical below this unique/rows ratio
+
+# Columns that identify one transaction, used to skip re-imported rows and as the
+# basis of its stable txn_id. Credit card exports have no reference, so the merchant stands in.
+# Year partitions (e.g. bank_transactions_2023) use the columns of their base worksheet.
+FINGERPRINT_COLS = {
+    "bank_transactions": ["account_number", "txn_timestamp", "amount", "reference"],
+    "credit_card": ["card_number", "txn_timestamp", "amount", "merchant"],
+}
+TXN_ID_LENGTH = 16
+
+
+def normalise_value(value):
+    text = str(value).strip()
+    try:
+        number = float(text.replace(",", ""))
+    except ValueError:
+        return text.upper()
+    return str(int(number)) if number.is_integer() else f"{number:.2f}"
+
+
+def row_fingerprint(worksheet_name, record):
+    """
+    Hashes the identifying columns of one transaction (a dict keyed by header).
+    Values are normalised so a CSV row and its copy read back from Sheets agree.
+    """
+    key = "|".join(normalise_value(record.get(col, "")) for col in FINGERPRINT_COLS[base_of(worksheet_name)])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def transaction_ids(df: pd.DataFrame, worksheet_name: str) -> pd.Series:
+    """
+    Stable ID per raw row: a prefix of its fingerprint, so it survives row moves and
+    timestamp re-parsing and is identical for a row and its re-imported copy.
+    Identical transactions are told apart by copy number in row order: the first keeps
+    the bare prefix, the n-th gets "-n" appended.
+    """
+    cols = [col for col in FINGERPRINT_COLS[base_of(worksheet_name)] if col in df.columns]
+    prefixes = pd.Series([row_fingerprint(worksheet_name, dict(zip(cols, values)))[:TXN_ID_LENGTH]
+                          for values in df[cols].itertuples(index=False, name=None)], dtype="object")
+    copy = prefixes.groupby(prefixes).cumcount() + 1
+    ids = prefixes.where(copy == 1, prefixes + "-" + copy.astype(str))
+    return pd.Series(ids.values, index=df.index, dtype="object")
+
+
+def parse_timestamps(values: pd.Series) -> pd.Series:
+    """
+    Parses a timestamp column into tz-naive UTC datetime64. ISO values take the fast path,
+    anything else falls back to mixed-format parsing; unparseable values become NaT.
+    """
+    text = values.astype("string").str.strip()
+    parsed = pd.to_datetime(text, utc=True, errors="coerce", format="ISO8601")
+    pending = parsed.isna() & text.notna() & (text != "")
+    if pending.any():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            parsed[pending] = pd.to_datetime(text[pending], utc=True, errors="coerce", format="mixed")
+    return parsed.dt.tz_localize(None)
+
+
+def downcast_money(values: pd.Series) -> pd.Series:
+    numbers = pd.to_numeric(values, errors="coerce")
+    if numbers.notna().all() and (numbers % 1 == 0).all():
+        return pd.to_numeric(numbers.astype("int64"), downcast="integer")
+    return numbers.astype("float64")
+
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a typed copy of a raw bank or credit card frame (as read from the sheet mirror).
+    """
+    typed = df.copy()
+    for col in typed.columns:
+        if col == TIMESTAMP_COL:
+            typed[col] = parse_timestamps(typed[col])
+        elif col in NUMERIC_COLS:
+            typed[col] = downcast_money(typed[col])
+        elif col in CATEGORICAL_COLS:
+            text = typed[col].fillna("").astype(str).str.strip()
+            typed[col] = (text.str.upper() if col in UPPER_COLS else text).astype("category")
+        elif typed[col].dtype == object and len(typed) and typed[col].nunique() / len(typed) < AUTO_CATEGORY_RATIO:
+            typed[col] = typed[col].astype(str).astype("category")
+    return typed
+
+
+def to_transactions(raw: pd.DataFrame, worksheet_name: str) -> pd.DataFrame:
+    typed = apply_schema(raw)
+    typed["txn_id"] = transaction_ids(raw, worksheet_name)
+    return typed
+